@@ -0,0 +1,94 @@
+"""
+Simulated Telegram media session shared by the bench scripts.
+
+FakeStreamer is a ByteStreamer whose GetFile replies are generated locally
+after a simulated round trip, so the real read-ahead pipeline, chunk ring
+and scheduler accounting run without Telegram access. Importing this module
+sets the environment bot.config needs and moves to a scratch directory,
+since importing bot writes log.txt and .server_secret to the working
+directory.
+"""
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+from itertools import count
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# bot.config reads these at import time; nothing connects to them here.
+os.environ.setdefault('DATABASE_URL', 'mongodb://localhost')
+os.environ.setdefault('CHUNK_CACHE_SIZE_MB', '0')
+os.chdir(tempfile.mkdtemp(prefix='surf-bench-'))
+
+from bot.server.custom_dl import ByteStreamer  # noqa: E402
+from bot.telegram.scheduler import scheduler  # noqa: E402
+
+MiB = 1024 * 1024
+media_ids = count(1)
+scheduler.register(0)
+
+
+class Reply(bytes):
+    """
+    GetFile reply payload. Slicing it with [a:b] returns a plain bytes
+    copy, so a plain bytes chunk in a body is a copy made on the way.
+    """
+
+
+def is_copy(chunk) -> bool:
+    return type(chunk) is bytes
+
+
+def fake_streamer(base=ByteStreamer, rtt: float = 0.0, bandwidth: float = 0.0, file_size: int = 1 << 40):
+    """
+    A `base` (ByteStreamer or an older copy of it) answering GetFile after
+    `rtt` seconds plus the reply size over `bandwidth` bytes/s per request.
+    """
+
+    class FakeStreamer(base):
+        def __init__(self):
+            super().__init__(SimpleNamespace(name='bench', me=SimpleNamespace(id=0)))
+            self.requests = 0
+            self.fetched = 0
+
+        async def generate_media_session(self, client, file_id):
+            return None
+
+        @staticmethod
+        async def get_location(file_id):
+            return None
+
+        async def get_part(self, media_session, location, offset, chunk_size):
+            self.requests += 1
+            size = max(0, min(chunk_size, file_size - offset))
+            self.fetched += size
+            if rtt or bandwidth:
+                await asyncio.sleep(rtt + (size / bandwidth if bandwidth else 0))
+            return Reply(size)
+
+    return FakeStreamer()
+
+
+def new_file_id(file_size: int = 1 << 40):
+    """A FileId stand-in no earlier run has touched, so the chunk ring starts cold."""
+    return SimpleNamespace(media_id=next(media_ids), unique_id=None, file_reference=b'', file_size=file_size, dc_id=1)
+
+
+def range_params(from_bytes: int, until_bytes: int, chunk_size: int) -> tuple:
+    """yield_file's (offset, first_part_cut, last_part_cut, part_count) for a range, as stream_range computes them."""
+    offset = from_bytes - (from_bytes % chunk_size)
+    return offset, from_bytes - offset, until_bytes % chunk_size + 1, until_bytes // chunk_size - offset // chunk_size + 1
+
+
+def historic(revision: str, path: str = 'bot/server/custom_dl.py'):
+    """Import `path` as it was at `revision`, against the current versions of its imports."""
+    source = subprocess.run(['git', '-C', ROOT, 'show', f'{revision}:{path}'], check=True, capture_output=True).stdout
+    name = f"bench_{path.replace('/', '_')[:-3]}_{revision.replace('^', '_parent').replace('~', '_')}"
+    spec = importlib.util.spec_from_loader(name, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    exec(compile(source, f'{revision}:{path}', 'exec'), module.__dict__)
+    return module
@@ -0,0 +1,69 @@
+"""
+Time to first byte and throughput of ranges of different sizes with the
+old fixed 1 MiB GetFile parts and with get_chunk_size.
+
+Each range goes through the real yield_file pipeline against the simulated
+session in fake_session.py, where a GetFile takes a round trip plus the
+reply size over a per-request bandwidth, so fetching a whole MiB for a
+4 KiB probe costs transfer time as well as bytes. Both sizings use the
+same pipeline and read-ahead; only the part size differs.
+
+    python bench/part_size.py [--rtt 0.1] [--bandwidth-mb 8]
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+from fake_session import MiB, fake_streamer, new_file_id, range_params
+
+from bot.server.custom_dl import MAX_CHUNK_SIZE, get_chunk_size  # noqa: E402
+
+KiB = 1024
+FILE_SIZE = 1536 * MiB
+# (label, first byte, length): player probes, a moov read at the tail, one
+# MiB, a seek-sized read and a long sequential read.
+RANGES = [
+    ('4 KiB probe', 0, 4 * KiB),
+    ('16 KiB tail probe', FILE_SIZE - 16 * KiB, 16 * KiB),
+    ('64 KiB across a MiB edge', 3 * MiB - 32 * KiB, 64 * KiB),
+    ('300 KiB moov', 700 * MiB + 123, 300 * KiB),
+    ('1 MiB', 5 * MiB + 4321, MiB),
+    ('8 MiB', 9 * MiB, 8 * MiB),
+    ('64 MiB', 100 * MiB + 77, 64 * MiB),
+]
+
+
+async def read(chunk_size: int, from_bytes: int, until_bytes: int, rtt: float, bandwidth: float) -> dict:
+    streamer = fake_streamer(rtt=rtt, bandwidth=bandwidth, file_size=FILE_SIZE)
+    served, first = 0, None
+    started = perf_counter()
+    body = streamer.yield_file(new_file_id(FILE_SIZE), 0, *range_params(from_bytes, until_bytes, chunk_size), chunk_size)
+    try:
+        async for chunk in body:
+            first = first or perf_counter() - started
+            served += len(chunk)
+    finally:
+        await body.aclose()
+    elapsed = perf_counter() - started
+    assert served == until_bytes - from_bytes + 1, (served, until_bytes - from_bytes + 1)
+    return {'ttfb ms': round(first * 1000), 'MiB/s': round(served / MiB / elapsed, 2),
+            'parts': streamer.requests, 'fetched KiB': streamer.fetched // KiB}
+
+
+async def main(args) -> None:
+    bandwidth = args.bandwidth_mb * MiB
+    print(f"rtt {args.rtt * 1000:.0f} ms, {args.bandwidth_mb} MiB/s per request")
+    for label, from_bytes, length in RANGES:
+        until_bytes = from_bytes + length - 1
+        sized = get_chunk_size(from_bytes, until_bytes)
+        fixed = await read(MAX_CHUNK_SIZE, from_bytes, until_bytes, args.rtt, bandwidth)
+        new = await read(sized, from_bytes, until_bytes, args.rtt, bandwidth)
+        print(f"{label:<26} fixed 1 MiB: {fixed}")
+        print(f"{'':<26} {sized // KiB:>5} KiB: {new}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rtt', type=float, default=0.1, help='seconds per GetFile round trip')
+    parser.add_argument('--bandwidth-mb', type=float, default=8, help='MiB/s a single GetFile reply arrives at')
+    asyncio.run(main(parser.parse_args()))
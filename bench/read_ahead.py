@@ -0,0 +1,61 @@
+"""
+Throughput of ByteStreamer.yield_file with and without read-ahead.
+
+Streams a range through the real pipeline against the simulated session in
+fake_session.py, where every GetFile takes a round trip plus the reply size
+over a per-request bandwidth. STREAM_PREFETCH=1 keeps one request in flight
+at a time, like the serial loop it replaced; higher values overlap that
+many. Besides a full read, each setting is run for a viewer that seeks away
+after a few MiB, to show the GetFile calls read-ahead issues for nothing.
+
+    python bench/read_ahead.py [--rtt 0.1] [--bandwidth-mb 8] [--mib 32] [--prefetch 1,2,4,8]
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+from fake_session import MiB, fake_streamer, new_file_id
+
+from bot.config import Telegram  # noqa: E402
+from bot.server.custom_dl import stream_stats  # noqa: E402
+
+
+async def stream(prefetch: int, rtt: float, bandwidth: float, size_mib: int, stop_mib: int = 0) -> dict:
+    Telegram.STREAM_PREFETCH = prefetch
+    streamer = fake_streamer(rtt=rtt, bandwidth=bandwidth)
+    cancelled = stream_stats['cancelled_parts']
+    served, first = 0, None
+    started = perf_counter()
+    body = streamer.stream_range(new_file_id(), 0, 0, size_mib * MiB - 1)
+    try:
+        async for chunk in body:
+            first = first or perf_counter() - started
+            served += len(chunk)
+            if stop_mib and served >= stop_mib * MiB:
+                break
+    finally:
+        await body.aclose()
+    elapsed = perf_counter() - started
+    return {'MiB/s': round(served / MiB / elapsed, 2), 'ttfb ms': round(first * 1000),
+            'GetFile calls': streamer.requests, 'parts served': served // MiB,
+            'cancelled': stream_stats['cancelled_parts'] - cancelled}
+
+
+async def main(args) -> None:
+    bandwidth = args.bandwidth_mb * MiB
+    print(f"rtt {args.rtt * 1000:.0f} ms, {args.bandwidth_mb} MiB/s per request, "
+          f"STREAM_BUFFER_MB {Telegram.STREAM_BUFFER_MB}")
+    for prefetch in args.prefetch:
+        full = await stream(prefetch, args.rtt, bandwidth, args.mib)
+        seek = await stream(prefetch, args.rtt, bandwidth, args.mib, stop_mib=4)
+        print(f"STREAM_PREFETCH={prefetch:<2} read {args.mib} MiB: {full}")
+        print(f"{'':17} seek after 4 MiB: {seek}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rtt', type=float, default=0.1, help='seconds per GetFile round trip')
+    parser.add_argument('--bandwidth-mb', type=float, default=8, help='MiB/s a single GetFile reply arrives at')
+    parser.add_argument('--mib', type=int, default=32, help='size of the streamed range')
+    parser.add_argument('--prefetch', type=lambda value: [int(n) for n in value.split(',')], default=[1, 2, 4, 8])
+    asyncio.run(main(parser.parse_args()))
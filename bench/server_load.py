@@ -0,0 +1,171 @@
+"""
+Idle keep-alive and streaming load against the web app with aiohttp's
+default server settings and with the ones start_services passes.
+
+For each setting the app from bot.server.web_server() runs in its own
+process, with two extra routes: a small text response and a stream served
+by send_body from the simulated session in fake_session.py. The driver
+then
+  1. opens --idle connections at once, sends one keep-alive request on
+     each and leaves them open, recording connect and response times;
+  2. reads the server's RSS, so the cost of an idle connection shows;
+  3. runs --streams concurrent downloads of --mib MiB on top of that,
+     recording time to first byte and aggregate throughput.
+
+"old" is web.AppRunner(app) and web.TCPSite(..., reuse_address, reuse_port)
+with nothing else set, as before the settings became tunable; "new" passes
+the same options as bot/__main__.py, read from the same config.
+
+    python bench/server_load.py [--idle 2000] [--streams 50] [--mib 8] [--rtt 0.05]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+from fake_session import MiB, ROOT, fake_streamer, new_file_id
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+PING = b"GET /bench/ping HTTP/1.1\r\nHost: bench\r\nConnection: keep-alive\r\n\r\n"
+
+
+def quantile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+async def serve(mode: str, port: int, rtt: float) -> None:
+    from logging import INFO
+    from aiohttp.log import access_logger
+    from bot.config import Telegram
+    from bot.server import web_server
+    from bot.server.stream_routes import send_body
+
+    async def ping(request):
+        return web.Response(text='pong')
+
+    async def stream(request):
+        size = int(request.query['mib']) * MiB
+        body = fake_streamer(rtt=rtt).stream_range(new_file_id(), 0, 0, size - 1)
+        response = web.StreamResponse(headers={'Content-Length': str(size), 'Content-Type': 'video/mp4'})
+        return await send_body(request, response, body, 0, True)
+
+    app = await web_server()
+    app.router.add_get('/bench/ping', ping)
+    app.router.add_get('/bench/stream', stream)
+    if mode == 'old':
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', port, reuse_address=True, reuse_port=True)
+    else:
+        if Telegram.ACCESS_LOG:
+            access_logger.setLevel(INFO)
+        runner = web.AppRunner(
+            app,
+            keepalive_timeout=Telegram.KEEPALIVE_TIMEOUT,
+            handler_cancellation=Telegram.HANDLER_CANCELLATION,
+            read_bufsize=Telegram.READ_BUFSIZE_KB * 1024,
+            access_log=access_logger if Telegram.ACCESS_LOG else None,
+        )
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', port, backlog=Telegram.BACKLOG, reuse_address=True, reuse_port=True)
+    await site.start()
+    await asyncio.Event().wait()
+
+
+def rss_kib(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+
+async def wait_ready(port: int) -> None:
+    for _ in range(200):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError('server did not start')
+
+
+async def idle_connection(port: int, timings: dict, open_connections: list) -> None:
+    started = perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 30)
+        timings['connect'].append(perf_counter() - started)
+        writer.write(PING)
+        await reader.readuntil(b'pong')
+        timings['response'].append(perf_counter() - started)
+        open_connections.append(writer)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        timings['failed'] += 1
+
+
+async def download(session: aiohttp.ClientSession, port: int, size_mib: int) -> tuple:
+    started = perf_counter()
+    first, received = None, 0
+    async with session.get(f'http://127.0.0.1:{port}/bench/stream?mib={size_mib}') as resp:
+        async for data in resp.content.iter_any():
+            first = first or perf_counter() - started
+            received += len(data)
+    return first, received
+
+
+async def run(mode: str, args, port: int) -> None:
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port), '--rtt', str(args.rtt)],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    open_connections = []
+    try:
+        await wait_ready(port)
+        await asyncio.sleep(0.5)
+        baseline = rss_kib(server.pid)
+        timings = {'connect': [], 'response': [], 'failed': 0}
+        await asyncio.gather(*[idle_connection(port, timings, open_connections) for _ in range(args.idle)])
+        await asyncio.sleep(0.5)
+        idle_rss = rss_kib(server.pid)
+        print(f"{mode}: {len(open_connections)}/{args.idle} idle connections open, {timings['failed']} failed, "
+              f"connect p50/p99 {median(timings['connect']) * 1000:.1f}/{quantile(timings['connect'], 0.99) * 1000:.1f} ms, "
+              f"first response p99 {quantile(timings['response'], 0.99) * 1000:.1f} ms, "
+              f"server RSS +{(idle_rss - baseline) / 1024:.1f} MiB ({(idle_rss - baseline) / max(1, len(open_connections)):.1f} KiB per connection)")
+
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = perf_counter()
+            results = await asyncio.gather(*[download(session, port, args.mib) for _ in range(args.streams)])
+            elapsed = perf_counter() - started
+        ttfb = [first for first, _ in results]
+        total = sum(received for _, received in results)
+        print(f"{'':{len(mode)}}  {args.streams} streams of {args.mib} MiB: {total / MiB / elapsed:.1f} MiB/s total, "
+              f"ttfb p50/p99 {median(ttfb) * 1000:.0f}/{quantile(ttfb, 0.99) * 1000:.0f} ms, "
+              f"peak server RSS +{(rss_kib(server.pid) - baseline) / 1024:.1f} MiB")
+    finally:
+        for writer in open_connections:
+            writer.close()
+        server.terminate()
+        server.wait()
+
+
+async def main(args) -> None:
+    for offset, mode in enumerate(('old', 'new')):
+        await run(mode, args, args.port + offset)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', choices=('old', 'new'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=8971)
+    parser.add_argument('--idle', type=int, default=2000, help='idle keep-alive connections')
+    parser.add_argument('--streams', type=int, default=50, help='concurrent downloads')
+    parser.add_argument('--mib', type=int, default=8, help='size of each download')
+    parser.add_argument('--rtt', type=float, default=0.05, help='seconds per simulated GetFile')
+    args = parser.parse_args()
+    if args.serve:
+        asyncio.run(serve(args.serve, args.port, args.rtt))
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,116 @@
+"""
+Copies, CPU and memory per served MiB when streaming a range over HTTP.
+
+Both cases run a real yield_file against the simulated session in
+fake_session.py and serve it through aiohttp to a loopback client:
+
+- before: ByteStreamer as of 5fa3be6^, which cut the first and last reply
+  with chunk[a:b], handed to aiohttp as web.Response(body=<generator>) the
+  way media_streamer did then;
+- after: the current ByteStreamer, which cuts with memoryview slices,
+  written through send_body.
+
+A chunk counts as a copy when it reaches the response as a plain bytes
+object instead of a GetFile reply or a view of one; the bench only looks
+at the chunks and never copies them itself. CPU time covers the whole
+process (server and client), peak memory is traced in a second pass.
+
+    python bench/yield_file_copies.py [MiB]
+"""
+import asyncio
+import sys
+import tracemalloc
+from time import perf_counter, process_time
+
+from fake_session import MiB, historic, is_copy, fake_streamer, new_file_id, range_params
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+from bot.server.custom_dl import get_chunk_size  # noqa: E402
+from bot.server.stream_routes import send_body  # noqa: E402
+
+BEFORE = '5fa3be6^'
+PORT = 8961
+seen = {'copies': 0, 'copied': 0}
+
+
+async def observe(body):
+    try:
+        async for chunk in body:
+            if is_copy(chunk):
+                seen['copies'] += 1
+                seen['copied'] += len(chunk)
+            yield chunk
+    finally:
+        await body.aclose()
+
+
+def requested_range(request: web.Request):
+    size = int(request.query['mib']) * MiB
+    # An unaligned range, so the first and last part are both cut.
+    return 123, size - 456
+
+
+async def before(request: web.Request):
+    from_bytes, until_bytes = requested_range(request)
+    chunk_size = get_chunk_size(from_bytes, until_bytes)
+    streamer = fake_streamer(request.app['old'].ByteStreamer)
+    body = streamer.yield_file(new_file_id(), 0, *range_params(from_bytes, until_bytes, chunk_size), chunk_size)
+    return web.Response(status=206, body=observe(body), headers={'Content-Length': str(until_bytes - from_bytes + 1)})
+
+
+async def after(request: web.Request):
+    from_bytes, until_bytes = requested_range(request)
+    body = fake_streamer().stream_range(new_file_id(), 0, from_bytes, until_bytes)
+    response = web.StreamResponse(status=206, headers={'Content-Length': str(until_bytes - from_bytes + 1)})
+    return await send_body(request, response, observe(body), 0, False)
+
+
+async def fetch(session: aiohttp.ClientSession, case: str, size_mib: int) -> int:
+    received = 0
+    async with session.get(f'http://127.0.0.1:{PORT}/{case}?mib={size_mib}') as resp:
+        async for data in resp.content.iter_chunked(MiB):
+            received += len(data)
+    return received
+
+
+async def measure(session, case: str, size_mib: int, traced: bool) -> dict:
+    seen.update(copies=0, copied=0)
+    if traced:
+        tracemalloc.start()
+    cpu, wall = process_time(), perf_counter()
+    received = await fetch(session, case, size_mib)
+    cpu, wall = process_time() - cpu, perf_counter() - wall
+    peak = 0
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    served = received / MiB
+    return {'served MiB': round(served, 2), 'copies/MiB': round(seen['copies'] / served, 4),
+            'copied bytes/MiB': round(seen['copied'] / served), 'cpu ms/MiB': round(cpu * 1000 / served, 3),
+            'MiB/s': round(served / wall), 'peak traced MiB': round(peak / MiB, 2)}
+
+
+async def main(size_mib: int, rounds: int = 5) -> None:
+    app = web.Application()
+    app['old'] = historic(BEFORE)
+    app.router.add_get('/before', before)
+    app.router.add_get('/after', after)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            for case in ('before', 'after'):
+                await fetch(session, case, 1)
+                # Best of several rounds for CPU; one traced round for the peak.
+                runs = [await measure(session, case, size_mib, False) for _ in range(rounds)]
+                result = min(runs, key=lambda run: run['cpu ms/MiB'])
+                result['peak traced MiB'] = (await measure(session, case, size_mib, True))['peak traced MiB']
+                print(case, result)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 64))
@@ -1,17 +1,23 @@
-from asyncio import get_event_loop, sleep as asleep, gather
+from asyncio import create_task, get_event_loop, sleep as asleep, gather
 from traceback import format_exc
 import json
 import os
 import signal
+from logging import INFO
 
 from aiohttp import web
+from aiohttp.log import access_logger
 from pyrogram import idle
 from pyrogram.enums.parse_mode import ParseMode
 
 from bot import __version__, LOGGER
 from bot.config import Telegram
 from bot.server import web_server
-from bot.telegram import StreamBot, UserBot
+from bot.helper.index import fetch_history
+from bot.helper.search import fetch_search
+from bot.helper.workers import serve_relay, share_load, supervisor
+from bot.server.session_pool import session_pool
+from bot.telegram import StreamBot, UserBot, multi_clients
 from bot.telegram.clients import initialize_clients
 
 loop = get_event_loop()
@@ -65,13 +71,14 @@ async def _send_update_notification():
 
 async def start_services():
     global _runner
-    LOGGER.info(f'Initializing Natking-TG v-{__version__}')
+    LOGGER.info(f'Initializing Natking-TG v-{__version__}' + (f' (web worker {Telegram.WORKER_ID})' if Telegram.WORKER_ID else ''))
     await asleep(1.2)
     
     await StreamBot.start()
     StreamBot.username = StreamBot.me.username
     LOGGER.info(f"Bot Client : [@{StreamBot.username}]")
-    if len(Telegram.SESSION_STRING) != 0:
+    # A user session must not be connected from several processes at once.
+    if len(Telegram.SESSION_STRING) != 0 and Telegram.WORKER_ID == 0:
         await UserBot.start()
         UserBot.username = UserBot.me.username or UserBot.me.first_name or UserBot.me.id
         LOGGER.info(f"User Client : {UserBot.username}")
@@ -79,10 +86,19 @@ async def start_services():
     await asleep(1.2)
     LOGGER.info("Initializing Multi Clients")
     await initialize_clients()
+    create_task(session_pool.start(multi_clients.values(), Telegram.MEDIA_PREWARM_DCS))
     
     await asleep(2)
     LOGGER.info('Initalizing Surf Web Server..')
-    _runner = web.AppRunner(await web_server())
+    if Telegram.ACCESS_LOG:
+        access_logger.setLevel(INFO)
+    _runner = web.AppRunner(
+        await web_server(),
+        keepalive_timeout=Telegram.KEEPALIVE_TIMEOUT,
+        handler_cancellation=Telegram.HANDLER_CANCELLATION,
+        read_bufsize=Telegram.READ_BUFSIZE_KB * 1024,
+        access_log=access_logger if Telegram.ACCESS_LOG else None,
+    )
     LOGGER.info("Server CleanUp!")
     await _runner.cleanup()
     
@@ -90,24 +106,34 @@ async def start_services():
     LOGGER.info("Server Setup Started !")
     
     await _runner.setup()
-    await web.TCPSite(_runner, '0.0.0.0', Telegram.PORT, reuse_address=True, reuse_port=True).start()
+    await web.TCPSite(_runner, '0.0.0.0', Telegram.PORT, backlog=Telegram.BACKLOG, reuse_address=True, reuse_port=True).start()
 
     LOGGER.info("Natking-TG Started Revolving !")
-    
+
+    if Telegram.WEB_WORKERS > 1:
+        create_task(share_load())
+        if Telegram.WORKER_ID == 0:
+            supervisor.start()
+            if len(Telegram.SESSION_STRING) != 0:
+                create_task(serve_relay({'history': fetch_history, 'search': fetch_search}))
+
     # Post-restart notification (after /update command)
-    await _send_update_notification()
+    if Telegram.WORKER_ID == 0:
+        await _send_update_notification()
     
     await idle()
 
 async def stop_clients():
     global _runner
+    if Telegram.WORKER_ID == 0:
+        await supervisor.stop()
     # Cleanup the web server first to release the port
     if _runner is not None:
         LOGGER.info("Cleaning up web server...")
         await _runner.cleanup()
         _runner = None
     await StreamBot.stop()
-    if len(Telegram.SESSION_STRING) != 0:
+    if len(Telegram.SESSION_STRING) != 0 and Telegram.WORKER_ID == 0:
         await UserBot.stop()
 
 
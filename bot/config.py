@@ -23,6 +23,54 @@ class Telegram:
     WORKERS = int(getenv('WORKERS', '10'))
     MULTI_CLIENT = getenv('MULTI_CLIENT', 'False')
     MAX_CONCURRENT = int(getenv('MAX_CONCURRENT', '15'))
+    FILE_CACHE_SIZE = int(getenv('FILE_CACHE_SIZE', '2000'))
+    FILE_CACHE_TTL = int(getenv('FILE_CACHE_TTL', '1800'))
+    FILE_REF_RETRIES = int(getenv('FILE_REF_RETRIES', '3'))
+    MEDIA_SESSIONS_PER_DC = int(getenv('MEDIA_SESSIONS_PER_DC', '1'))
+    MEDIA_PREWARM_DCS = [int(dc) for dc in getenv('MEDIA_PREWARM_DCS', '').split(',') if dc.strip().isdigit()]
+    MEDIA_SESSION_PING = int(getenv('MEDIA_SESSION_PING', '60'))
+    STREAM_PREFETCH = int(getenv('STREAM_PREFETCH', '4'))
+    STREAM_BUFFER_MB = int(getenv('STREAM_BUFFER_MB', '8'))
+    STREAM_GLOBAL_BUFFER_MB = int(getenv('STREAM_GLOBAL_BUFFER_MB', '512'))
+    CHUNK_RING_PARTS = int(getenv('CHUNK_RING_PARTS', '32'))
+    CHUNK_CACHE_DIR = getenv('CHUNK_CACHE_DIR', 'cache/chunks')
+    CHUNK_CACHE_SIZE_MB = int(getenv('CHUNK_CACHE_SIZE_MB', '0'))
+    RATE_LIMIT_IP_KB = int(getenv('RATE_LIMIT_IP_KB', '0'))
+    RATE_LIMIT_USER_KB = int(getenv('RATE_LIMIT_USER_KB', '0'))
+    RATE_LIMIT_GLOBAL_KB = int(getenv('RATE_LIMIT_GLOBAL_KB', '0'))
+    INLINE_STREAM_WEIGHT = int(getenv('INLINE_STREAM_WEIGHT', '4'))
+    HLS_STREAMING = getenv('HLS_STREAMING', 'False').lower() == 'true'
+    HLS_SEGMENT_SECONDS = int(getenv('HLS_SEGMENT_SECONDS', '6'))
+    HLS_MAX_JOBS = int(getenv('HLS_MAX_JOBS', '4'))
+    STRIPE_DOWNLOADS = getenv('STRIPE_DOWNLOADS', 'False').lower() == 'true'
+    STRIPE_CLIENTS = int(getenv('STRIPE_CLIENTS', '4'))
+    STRIPE_MIN_SIZE_MB = int(getenv('STRIPE_MIN_SIZE_MB', '64'))
+    MEDIA_INDEX = getenv('MEDIA_INDEX', 'True').lower() == 'true'
+    MOOV_CACHE_SIZE = int(getenv('MOOV_CACHE_SIZE', '16'))
+    INDEX_CACHE_FILES = int(getenv('INDEX_CACHE_FILES', '5000'))
+    MOOV_MAX_MB = int(getenv('MOOV_MAX_MB', '8'))
+    FASTSTART_STREAMING = getenv('FASTSTART_STREAMING', 'False').lower() == 'true'
+    KEEPALIVE_TIMEOUT = float(getenv('KEEPALIVE_TIMEOUT', '75'))
+    BACKLOG = int(getenv('BACKLOG', '1024'))
+    HANDLER_CANCELLATION = getenv('HANDLER_CANCELLATION', 'False').lower() == 'true'
+    ACCESS_LOG = getenv('ACCESS_LOG', 'False').lower() == 'true'
+    READ_BUFSIZE_KB = int(getenv('READ_BUFSIZE_KB', '256'))
+    WATCH_PREFETCH_MB = int(getenv('WATCH_PREFETCH_MB', '4'))
+    PREFETCH_JOBS = int(getenv('PREFETCH_JOBS', '2'))
+    PREFETCH_BUDGET_MB = int(getenv('PREFETCH_BUDGET_MB', '256'))
+    THUMB_CACHE_SIZE_MB = int(getenv('THUMB_CACHE_SIZE_MB', '256'))
+    THUMB_WORKERS = int(getenv('THUMB_WORKERS', '4'))
+    THUMB_QUEUE = int(getenv('THUMB_QUEUE', '32'))
+    THUMB_WAIT = float(getenv('THUMB_WAIT', '5'))
+    THUMB_PREFETCH = getenv('THUMB_PREFETCH', 'True').lower() == 'true'
+    THUMB_RESIZE = getenv('THUMB_RESIZE', 'True').lower() == 'true'
+    THUMB_FORMATS = [fmt.strip().lower() for fmt in getenv('THUMB_FORMATS', 'avif,webp').split(',') if fmt.strip()]
+    THUMB_CARD_WIDTH = int(getenv('THUMB_CARD_WIDTH', '320'))
+    THUMB_PROCS = int(getenv('THUMB_PROCS', '2'))
+    SPRITE_THUMBS = getenv('SPRITE_THUMBS', 'False').lower() == 'true'
+    WEB_WORKERS = int(getenv('WEB_WORKERS', '1'))
+    WORKER_ID = int(getenv('WORKER_ID', '0'))
+    SHARED_STORE = getenv('SHARED_STORE', 'cache/shared.db')
     HIDE_CHANNEL = getenv('HIDE_CHANNEL', 'False')
     OWNER_ID = int(getenv('OWNER_ID', '0'))
     SUDO_USERS = {int(x) for x in getenv("SUDO_USERS", "").split() if x.isdigit()}
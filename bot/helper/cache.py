@@ -1,5 +1,8 @@
 import os
 import json
+from asyncio import create_task, shield
+from collections import OrderedDict
+from time import monotonic
 
 from bot import LOGGER
 
@@ -15,6 +18,42 @@ def rm_cache(channel=None):
                 LOGGER.error(e)
     except Exception as e:
         LOGGER.error(e)
+    # Thumbnail sprite sheets of the same pages.
+    rm_sprites(f"{channel}-" if channel else None)
+
+
+def rm_sprites(prefix=None):
+    """Drop sprite sheets whose name starts with `prefix` ("<chat_id>-" or "db<folder>-"), or all of them."""
+    try:
+        for file in os.listdir("cache/sprites"):
+            if not prefix or file.startswith(prefix):
+                os.remove(f"cache/sprites/{file}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        LOGGER.error(e)
+
+
+def prune_files(root, keep, suffix=".json"):
+    """Delete all but the `keep` most recently used `suffix` files in `root`; readers bump mtime."""
+    try:
+        entries = []
+        for entry in os.scandir(root):
+            if entry.name.endswith(suffix):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - keep)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        LOGGER.error(e)
 
 
 def get_cache(channel, page):
@@ -27,4 +66,60 @@ def get_cache(channel, page):
 
 def save_cache(channel, cache, page):
     with open(f"cache/{channel}-{page}.json", "w") as f:
-        json.dump(cache, f)
\ No newline at end of file
+        json.dump(cache, f)
+
+class AsyncLRUCache:
+    """
+    Bounded LRU cache with a per-entry TTL and single-flight loading, so
+    concurrent misses for one key share a single call to the loader.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, loader):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires > monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = create_task(loader())
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await shield(task)
+
+    def peek(self, key):
+        """Cached value for `key` without loading it, or None."""
+        entry = self.entries.get(key)
+        if entry is None or entry[1] <= monotonic():
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def _done(self, key, task):
+        self.inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.set(key, task.result())
+
+    def set(self, key, value):
+        self.entries[key] = (value, monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
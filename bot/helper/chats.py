@@ -2,6 +2,8 @@ from asyncio import gather, create_task
 from bot.helper.database import Database
 from bot.telegram import StreamBot
 from bot.config import Telegram
+from bot.helper.sprites import BLANK, sprite_classes
+from bot.helper.thumbnail import card_url
 import base64
 
 db = Database()
@@ -85,7 +87,7 @@ async def posts_chat(channels):
                         <div class="img-container text-center"
                             style="width: 100px; height: 100px; display: inline-block; overflow: hidden; position: relative; border-radius: 50%; margin: 14px auto 0;">
                             <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif" class="card-img-top lzy_img"
-                                data-src="{img}" alt="{title}"
+                                data-src="{card}" alt="{title}"
                                 onerror="this.onerror=null;this.src='{fallback}'"
                                 style="object-fit: cover; width: 100%; height: 100%; position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%);">
                         </div>
@@ -100,7 +102,7 @@ async def posts_chat(channels):
                 </a>
             </div>
 """
-    return ''.join(phtml.format(cid=str(channel["chat-id"]).replace("-100", ""), img=f"/api/thumb/{channel['chat-id']}", title=channel["title"], ctype=channel['type'], fallback=CHANNEL_FALLBACK) for channel in channels)
+    return ''.join(phtml.format(cid=str(channel["chat-id"]).replace("-100", ""), img=f"/api/thumb/{channel['chat-id']}", card=card_url(f"/api/thumb/{channel['chat-id']}"), title=channel["title"], ctype=channel['type'], fallback=CHANNEL_FALLBACK) for channel in channels)
 
 
 async def post_playlist(playlists):
@@ -116,7 +118,7 @@ async def post_playlist(playlists):
                 <div class="img-container text-center"
                     style="width: 100px; height: 100px; display: inline-block; overflow: hidden; position: relative; border-radius: 50%; margin: 14px auto 0;">
                     <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif"
-                        class="card-img-top lzy_img" data-src="{img}" alt="{title}"
+                        class="card-img-top lzy_img" data-src="{card}" alt="{title}"
                         onerror="this.onerror=null;this.src='{fallback}'"
                         style="object-fit: cover; width: 100%; height: 100%; position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%);">
                 </div>
@@ -132,10 +134,10 @@ async def post_playlist(playlists):
     </div>
     """
 
-    return ''.join(dhtml.format(cid=playlist["_id"], img=playlist["thumbnail"] or FOLDER_FALLBACK, title=playlist["name"], ctype=playlist['parent_folder'], fallback=FOLDER_FALLBACK) for playlist in playlists)
+    return ''.join(dhtml.format(cid=playlist["_id"], img=playlist["thumbnail"] or FOLDER_FALLBACK, card=card_url(playlist["thumbnail"] or FOLDER_FALLBACK), title=playlist["name"], ctype=playlist['parent_folder'], fallback=FOLDER_FALLBACK) for playlist in playlists)
 
 
-async def posts_db_file(posts):
+async def posts_db_file(posts, sprite=None):
     phtml = """
     <div class="col">
 
@@ -146,8 +148,8 @@ async def posts_db_file(posts):
                 style="z-index: 2;"><i
                     class="bi bi-pencil-square" style="color: rgba(255,255,255,0.5);"></i></a>
             <a href="/watch/{chat_id}?id={id}&hash={hash}" style="text-decoration: none; color: inherit; display: block;">
-                <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif" data-src="{img}"
-                    class="card-img-top lzy_img" alt="{title}"
+                <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif" data-src="{card}"
+                    class="card-img-top lzy_img{tile}" alt="{title}"
                     onerror="this.onerror=null;this.src='{fallback}'">
                 <div class="card-body">
                     <h6 class="card-title">{title}</h6>
@@ -159,6 +161,7 @@ async def posts_db_file(posts):
 
     </div>
 """
+    tiles = sprite_classes(sprite)
     result = []
     for post in posts:
         fallback = _get_file_fallback(post.get('file_type', ''))
@@ -168,6 +171,8 @@ async def posts_db_file(posts):
             chat_id=str(post["chat_id"]).replace("-100", ""),
             id=post["file_id"],
             img=thumb,
+            card=BLANK if thumb in tiles else card_url(thumb),
+            tile=tiles.get(thumb, ''),
             title=post["name"],
             hash=post["hash"],
             size=post['size'],
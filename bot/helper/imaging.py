@@ -0,0 +1,34 @@
+"""
+Image work run in the resize process pool. This module deliberately
+imports nothing from the bot, so pool workers stay small and never
+inherit Telegram clients or event loop state.
+"""
+import os
+from math import ceil
+from typing import List
+
+from PIL import Image, ImageOps
+
+
+def make_variant(src: str, dst: str, width: int, fmt: str) -> int:
+    """Write `src` scaled down to `width` as `fmt` and return its size."""
+    with Image.open(src) as img:
+        img = img.convert('RGB')
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        tmp = f"{dst}.tmp"
+        img.save(tmp, format=fmt.upper(), quality=75 if fmt == 'jpeg' else 60)
+    os.replace(tmp, dst)
+    return os.path.getsize(dst)
+
+
+def compose_sprite(files: List[str], dst: str, columns: int, width: int, height: int, fmt: str) -> None:
+    """Paste `files` cropped to width x height into one sheet, kept at high quality as the master other formats are made from."""
+    sheet = Image.new('RGB', (columns * width, ceil(len(files) / columns) * height))
+    for i, file in enumerate(files):
+        with Image.open(file) as img:
+            tile = ImageOps.fit(img.convert('RGB'), (width, height), Image.LANCZOS)
+        sheet.paste(tile, ((i % columns) * width, (i // columns) * height))
+    tmp = f"{dst}.tmp"
+    sheet.save(tmp, format=fmt.upper(), quality=85)
+    os.replace(tmp, dst)
@@ -6,6 +6,9 @@ from bot.telegram import StreamBot, UserBot
 from bot.helper.file_size import get_readable_file_size
 from bot.helper.cache import get_cache, save_cache
 from bot.helper.chats import _get_file_fallback
+from bot.helper.sprites import BLANK, sprite_classes
+from bot.helper.thumbnail import card_url
+from bot.helper.workers import run_on_master
 from asyncio import gather
 
 db = Database()
@@ -51,6 +54,12 @@ async def get_files(chat_id, page=1):
         return await db.list_tgfiles(id=chat_id, page=page)
     if cache := get_cache(chat_id, int(page)):
         return cache
+    if Telegram.WORKER_ID:
+        return await run_on_master('history', chat_id, page)
+    return await fetch_history(chat_id, page)
+
+
+async def fetch_history(chat_id, page):
     posts = []
     async for post in UserBot.get_chat_history(chat_id=int(chat_id), limit=50, offset=(int(page) - 1) * 50):
         file = post.video or post.document
@@ -64,7 +73,7 @@ async def get_files(chat_id, page=1):
     save_cache(chat_id, {"posts": posts}, page)
     return posts
 
-async def posts_file(posts, chat_id):
+async def posts_file(posts, chat_id, sprite=None):
     phtml = """
             <div class="col">
                 
@@ -72,8 +81,8 @@ async def posts_file(posts, chat_id):
                         <input type="checkbox" class="admin-only form-check-input position-absolute top-0 end-0 m-2"
                             onchange="checkSendButton()" id="selectCheckbox"
                             data-id="{id}|{hash}|{title}|{size}|{type}|{img}">
-                        <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif" class="lzy_img card-img-top rounded-top"
-                            data-src="{img}" alt="{title}"
+                        <img src="https://cdn.jsdelivr.net/gh/weebzone/weebzone/data/Surf-TG/src/loading.gif" class="lzy_img card-img-top rounded-top{tile}"
+                            data-src="{card}" alt="{title}"
                             onerror="this.onerror=null;this.src='{fallback}'">
                         <a href="/watch/{chat_id}?id={id}&hash={hash}">
                         <div class="card-body p-1">
@@ -92,4 +101,9 @@ async def posts_file(posts, chat_id):
         if isinstance(s, str) and s:
             return s
         return "?"
-    return ''.join(phtml.format(chat_id=str(chat_id).replace("-100", ""), id=post["msg_id"], img=f"/api/thumb/{chat_id}?id={post['msg_id']}", title=post["title"], hash=post["hash"], size=_format_size(post.get('size', 0)), type=post['type'], fallback=_get_file_fallback(post.get('type', ''))) for post in posts)
+    tiles = sprite_classes(sprite)
+
+    def _card(post):
+        img = f"/api/thumb/{chat_id}?id={post['msg_id']}"
+        return phtml.format(chat_id=str(chat_id).replace("-100", ""), id=post["msg_id"], img=img, card=BLANK if img in tiles else card_url(img), tile=tiles.get(img, ''), title=post["title"], hash=post["hash"], size=_format_size(post.get('size', 0)), type=post['type'], fallback=_get_file_fallback(post.get('type', '')))
+    return ''.join(_card(post) for post in posts)
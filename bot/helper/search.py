@@ -4,11 +4,18 @@ from bot.helper.database import Database
 from bot.telegram import UserBot
 from os.path import splitext
 from bot.helper.file_size import get_readable_file_size
+from bot.helper.workers import run_on_master
 
 db = Database()
 async def search(chat_id, query, page):
     if Telegram.SESSION_STRING == '':
         return await db.search_tgfiles(id=chat_id, query=query, page=page)
+    if Telegram.WORKER_ID:
+        return await run_on_master('search', chat_id, query, page)
+    return await fetch_search(chat_id, query, page)
+
+
+async def fetch_search(chat_id, query, page):
     posts = []
     async for post in UserBot.search_messages(chat_id=int(chat_id), limit=50, query=str(query), offset=(int(page) - 1) * 50):
         file = post.video or post.document
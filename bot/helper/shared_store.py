@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import sqlite3
+from threading import Lock
+from time import time
+from typing import Any, Dict, Optional
+
+from bot.config import Telegram
+
+
+class SharedStore:
+    """
+    Small JSON key/value store in a local SQLite file, shared by the web
+    workers of one host. Every entry lives in a namespace and expires after
+    its TTL. With a single worker the store is disabled and every call is a
+    no-op, so callers can use it unconditionally.
+    """
+
+    def __init__(self, path: str, enabled: bool):
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (ns TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (ns, key))")
+            self._conn = conn
+        return self._conn
+
+    def _run(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    async def get(self, ns: str, key: str) -> Any:
+        if not self.enabled:
+            return None
+        rows = await asyncio.to_thread(self._run, "SELECT value FROM kv WHERE ns = ? AND key = ? AND expires > ?", (ns, key, time()))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._run, "INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)", (ns, key, json.dumps(value), time() + ttl))
+
+    async def delete(self, ns: str, key: str) -> None:
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._run, "DELETE FROM kv WHERE ns = ? AND key = ?", (ns, key))
+
+    async def items(self, ns: str) -> Dict[str, Any]:
+        if not self.enabled:
+            return {}
+        rows = await asyncio.to_thread(self._run, "SELECT key, value FROM kv WHERE ns = ? AND expires > ?", (ns, time()))
+        return {key: json.loads(value) for key, value in rows}
+
+    async def purge(self) -> None:
+        """Drop expired entries."""
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._run, "DELETE FROM kv WHERE expires <= ?", (time(),))
+
+
+shared_store = SharedStore(Telegram.SHARED_STORE, Telegram.WEB_WORKERS > 1)
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import re
+from hashlib import sha1
+from math import ceil
+from os import path as ospath
+from typing import List, Optional, Tuple
+
+from bot import LOGGER
+from bot.config import Telegram
+from bot.helper.imaging import compose_sprite, make_variant
+from bot.helper.thumbnail import VARIANT_TYPES, get_image, missing, parse_thumb_url, path, run_in_pool, variant_format
+
+SPRITE_DIR = ospath.join('cache', 'sprites')
+SPRITE_NAME = re.compile(r'^[\w-]+$')
+COLUMNS = 10
+# 1x1 transparent GIF, so a sprite card's <img> shows its CSS background.
+BLANK = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+
+
+class SpriteSheets:
+    """
+    One image per listing page holding every card thumbnail, so a page
+    costs a single image request. A sheet is named after its page and a
+    digest of the page's thumbnail URLs, so changed listings get a new
+    sheet, and is cleared by rm_cache along with the page caches.
+
+    Sheets are built in the background on the first render of a page and
+    only kept once every thumbnail that exists is in the store; until then
+    the page falls back to per-card images. The sheet is kept as a JPEG
+    master and converted to the format the browser accepts on first use.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.building = {}
+        self.converting = {}
+
+    @property
+    def enabled(self) -> bool:
+        return Telegram.SPRITE_THUMBS
+
+    @staticmethod
+    def sheet_name(prefix: str, page, urls: List[str]) -> str:
+        digest = sha1('\n'.join(urls).encode()).hexdigest()[:12]
+        return f"{prefix}-{page}-{digest}"
+
+    async def get(self, prefix: str, page, urls: List[Optional[str]]) -> Optional[dict]:
+        """The page's sheet ({'name', 'tiles', 'columns', 'rows'}) if built, else start building it."""
+        urls = [url for url in urls if parse_thumb_url(url)]
+        if not self.enabled or not urls:
+            return None
+        name = self.sheet_name(prefix, page, urls)
+        try:
+            with open(ospath.join(self.root, f"{name}.json"), 'r') as f:
+                sheet = json.load(f)
+            if 'name' in sheet:
+                return sheet
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            LOGGER.warning(f"Sprite map {name} unreadable: {e}")
+        if name not in self.building:
+            task = self.building[name] = asyncio.create_task(self.build(name, f"{prefix}-{page}-", urls))
+            task.add_done_callback(lambda _: self.building.pop(name, None))
+        return None
+
+    async def build(self, name: str, stale: str, urls: List[str]) -> None:
+        try:
+            thumbs = [parse_thumb_url(url) for url in urls]
+            images = await asyncio.gather(*[get_image(chat_id, message_id) for chat_id, message_id in thumbs])
+            tiles = [(url, img) for url, img in zip(urls, images) if img != path]
+            if not tiles or any(img == path and f"{chat_id}-{message_id}" not in missing for (chat_id, message_id), img in zip(thumbs, images)):
+                # Some thumbnails are still loading; try again on the next render.
+                return
+            columns = min(COLUMNS, len(tiles))
+            width = Telegram.THUMB_CARD_WIDTH
+            os.makedirs(self.root, exist_ok=True)
+            await run_in_pool(compose_sprite, [img for _, img in tiles], ospath.join(self.root, f"{name}.jpeg"), columns, width, width * 10 // 16, 'jpeg')
+            sheet = {'name': name, 'width': columns * width, 'tiles': [url for url, _ in tiles], 'columns': columns, 'rows': ceil(len(tiles) / columns)}
+            await asyncio.to_thread(self._save, name, stale, sheet)
+        except Exception as e:
+            LOGGER.warning(f"Could not build sprite {name}: {e}")
+
+    def _save(self, name: str, stale: str, sheet: dict) -> None:
+        # Older sheets of the same page are dropped.
+        for file in os.listdir(self.root):
+            if file.startswith(stale) and not file.startswith(f"{name}."):
+                os.remove(ospath.join(self.root, file))
+        tmp = ospath.join(self.root, f"{name}.json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(sheet, f)
+        os.replace(tmp, ospath.join(self.root, f"{name}.json"))
+
+    async def file(self, name: str, accept: str) -> Optional[Tuple[str, str]]:
+        """(path, content type) of a sheet in the best format `accept` allows, or None if there is no such sheet."""
+        master = ospath.join(self.root, f"{name}.jpeg")
+        if not SPRITE_NAME.match(name) or not ospath.exists(master):
+            return None
+        fmt = variant_format(accept)
+        if fmt == 'jpeg':
+            return master, VARIANT_TYPES['jpeg']
+        dst = ospath.join(self.root, f"{name}.{fmt}")
+        if not ospath.exists(dst):
+            try:
+                if (task := self.converting.get(dst)) is None:
+                    task = self.converting[dst] = asyncio.create_task(self._convert(master, dst, fmt))
+                    task.add_done_callback(lambda _: self.converting.pop(dst, None))
+                await asyncio.shield(task)
+            except Exception as e:
+                LOGGER.warning(f"Could not convert sprite {name} to {fmt}: {e}")
+                return master, VARIANT_TYPES['jpeg']
+        return dst, VARIANT_TYPES[fmt]
+
+    async def _convert(self, master: str, dst: str, fmt: str) -> None:
+        with open(ospath.join(self.root, f"{ospath.basename(master)[:-len('.jpeg')]}.json"), 'r') as f:
+            width = json.load(f)['width']
+        await run_in_pool(make_variant, master, dst, width, fmt)
+
+
+def sprite_classes(sheet: Optional[dict]) -> dict:
+    """Thumbnail URL -> extra <img> classes for the cards in `sheet`."""
+    return {url: f" sprite-thumb sp-{i}" for i, url in enumerate(sheet['tiles'])} if sheet else {}
+
+
+def sprite_css(sheet: Optional[dict]) -> str:
+    """CSS offset map placing each card of `sheet` on its tile."""
+    if not sheet:
+        return ''
+    columns, rows = sheet['columns'], sheet['rows']
+    rules = [f".sprite-thumb {{ background: url('/api/sprite/{sheet['name']}') no-repeat; background-size: {columns * 100}% {rows * 100}%; }}"]
+    for i in range(len(sheet['tiles'])):
+        x = i % columns * 100 / (columns - 1) if columns > 1 else 0
+        y = i // columns * 100 / (rows - 1) if rows > 1 else 0
+        rules.append(f".sp-{i} {{ background-position: {x:g}% {y:g}%; }}")
+    return "\n                    <style>\n                        " + "\n                        ".join(rules) + "\n                    </style>"
+
+
+sprite_sheets = SpriteSheets(SPRITE_DIR)
@@ -1,25 +1,470 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha1
 from os import path as ospath
+from time import monotonic, time
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from PIL import features
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
 from bot import LOGGER
-from bot.telegram import StreamBot
+from bot.config import Telegram
+from bot.helper.imaging import make_variant
+from bot.helper.shared_store import shared_store
+from bot.telegram import StreamBot, multi_clients
+from bot.telegram.scheduler import scheduler
 
-image_cache = {}
 path = ospath.join('bot/server/static', 'thumbnail.jpg')
+THUMB_DIR = ospath.join('cache', 'thumbs')
+INDEX_SAVE_DELAY = 5
+# Unindexed files younger than this may belong to another web worker.
+ORPHAN_GRACE = 60 * 60
+MISSING_SIZE = 4096
+# Channel avatars are shown at 100x100, message thumbnails fill a card.
+AVATAR_WIDTH = 100
+VARIANT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+VARIANT_NAME = re.compile(r'^(.+)\.\d+\.(?:avif|webp|jpeg)$')
+
+
+_pool: Optional[ProcessPoolExecutor] = None
 
-async def get_image(chat_id, message_id):
-    global image_cache
-    cache_key = f"{chat_id}-{message_id}" if message_id else f"{chat_id}"
-    if cache_key in image_cache:
-        return image_cache[cache_key]
+
+async def run_in_pool(func, *args):
+    """Run CPU-bound image work in the shared process pool, off the event loop."""
+    global _pool
+    if _pool is None:
+        # forkserver: forking this process (threads, live clients) can deadlock.
+        _pool = ProcessPoolExecutor(max_workers=Telegram.THUMB_PROCS, mp_context=multiprocessing.get_context('forkserver'))
     try:
-        if message_id is None:
-            chat = await StreamBot.get_chat(int(chat_id))
-            img = await StreamBot.download_media(str(chat.photo.big_file_id)) if chat.photo else path
+        return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+    except BrokenProcessPool:
+        _pool = None
+        raise
+
+
+class ThumbnailStore:
+    """
+    Thumbnails on disk named by file_unique_id, so messages sharing a
+    thumbnail share one file. A persisted index maps thumbnail keys
+    (chat or chat-message) to unique ids, so after a restart thumbnails are
+    served without asking Telegram again. The least recently used files
+    are evicted once the size budget is exceeded, and files the index does
+    not know about are removed when the store loads.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        # One index per web worker, each holding only that worker's keys.
+        self.index_path = ospath.join(root, 'index.json' if Telegram.WEB_WORKERS <= 1 else f'index-{Telegram.WORKER_ID}.json')
+        self.keys = {}
+        self.files: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._save_task = None
+        self._variants = {}
+
+    def file_path(self, unique_id: str) -> str:
+        return ospath.join(self.root, sha1(unique_id.encode()).hexdigest()[:2], f"{unique_id}.jpg")
+
+    def _read_index(self, index_path: str):
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            return index.get('keys', {}), index.get('files', [])
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            LOGGER.warning(f"Thumbnail index {index_path} unreadable: {e}")
+        return {}, []
+
+    def _load(self):
+        keys, files = self._read_index(self.index_path)
+        known = {self.file_path(unique_id): unique_id for unique_id, _ in files}
+        # Files in the other workers' indexes are theirs to evict.
+        shared = set()
+        for name in os.listdir(self.root):
+            index_path = ospath.join(self.root, name)
+            if name.startswith('index') and name.endswith('.json') and index_path != self.index_path:
+                shared.update(unique_id for unique_id, _ in self._read_index(index_path)[1])
+        expired = time() - ORPHAN_GRACE
+        present, variants = set(), []
+        for shard in os.listdir(self.root):
+            shard_dir = ospath.join(self.root, shard)
+            if not ospath.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                file = ospath.join(shard_dir, name)
+                if file in known:
+                    present.add(known[file])
+                elif match := VARIANT_NAME.match(name):
+                    variants.append((file, match.group(1)))
+                elif name[:-len('.jpg')] not in shared and ospath.getmtime(file) < expired:
+                    # Orphans and partial downloads (pyrogram's .temp files).
+                    os.remove(file)
+        for file, unique_id in variants:
+            if unique_id not in present and unique_id not in shared and ospath.getmtime(file) < expired:
+                os.remove(file)
+        files = [(unique_id, size) for unique_id, size in files if unique_id in present]
+        keys = {key: unique_id for key, unique_id in keys.items() if unique_id in present}
+        return keys, files
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            keys, files = await asyncio.to_thread(self._load)
+            self.keys = keys
+            for unique_id, size in files:
+                self.files[unique_id] = size
+                self.size += size
+            self._loaded = True
+            LOGGER.info(f"Thumbnail store loaded {len(self.files)} files ({self.size} bytes)")
+            await self._evict()
+
+    def _save(self, index: dict) -> None:
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    def _schedule_save(self) -> None:
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(INDEX_SAVE_DELAY)
+        index = {'keys': dict(self.keys), 'files': list(self.files.items())}
+        try:
+            await asyncio.to_thread(self._save, index)
+        except OSError as e:
+            LOGGER.warning(f"Could not save thumbnail index: {e}")
+
+    def _touch(self, unique_id: str) -> Optional[str]:
+        if unique_id not in self.files:
+            return None
+        file = self.file_path(unique_id)
+        if not ospath.exists(file):
+            self.size -= self.files.pop(unique_id)
+            return None
+        self.files.move_to_end(unique_id)
+        self._schedule_save()
+        return file
+
+    async def get(self, key: str) -> Optional[str]:
+        """Path of the thumbnail stored for `key`, if any."""
+        await self._ensure_loaded()
+        unique_id = self.keys.get(key)
+        return self._touch(unique_id) if unique_id else None
+
+    async def link(self, key: str, unique_id: str) -> Optional[str]:
+        """Point `key` at an already stored thumbnail, adopting one another worker downloaded."""
+        await self._ensure_loaded()
+        if unique_id not in self.files:
+            try:
+                size = ospath.getsize(self.file_path(unique_id))
+            except OSError:
+                return None
+            self.files[unique_id] = size
+            self.size += size
+        if file := self._touch(unique_id):
+            self.keys[key] = unique_id
+        return file
+
+    async def fetch(self, key: str, file_id: str, unique_id: str, client: Client = StreamBot) -> str:
+        """Download a thumbnail into the store unless it is already there."""
+        if file := await self.link(key, unique_id):
+            return file
+        file = await client.download_media(file_id, file_name=ospath.abspath(self.file_path(unique_id)))
+        if unique_id not in self.files:
+            size = ospath.getsize(file)
+            self.files[unique_id] = size
+            self.size += size
+        self.keys[key] = unique_id
+        self._schedule_save()
+        await self._evict()
+        return self.file_path(unique_id)
+
+    async def _evict(self) -> None:
+        victims = []
+        while self.size > self.max_bytes and len(self.files) > 1:
+            unique_id, size = self.files.popitem(last=False)
+            self.size -= size
+            victims.append(unique_id)
+        if not victims:
+            return
+        gone = set(victims)
+        self.keys = {key: unique_id for key, unique_id in self.keys.items() if unique_id not in gone}
+        await asyncio.to_thread(self._remove, [self.file_path(unique_id) for unique_id in victims])
+        self._schedule_save()
+
+    @staticmethod
+    def _remove(files) -> None:
+        for file in files:
+            # The original and every variant made from it.
+            prefix = ospath.basename(file)[:-len('.jpg')] + '.'
+            shard_dir = ospath.dirname(file)
+            try:
+                names = [name for name in os.listdir(shard_dir) if name.startswith(prefix)]
+            except FileNotFoundError:
+                continue
+            for name in names:
+                try:
+                    os.remove(ospath.join(shard_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    async def variant(self, file: str, width: int, fmt: str) -> str:
+        """
+        Path of the stored thumbnail `file` scaled down to `width` in `fmt`,
+        made on first use in a process pool and kept next to the original.
+        Its size counts towards the original's share of the disk budget.
+        """
+        dst = f"{file[:-len('.jpg')]}.{width}.{fmt}"
+        if ospath.exists(dst):
+            return dst
+        if task := self._variants.get(dst):
+            return await asyncio.shield(task)
+        task = self._variants[dst] = asyncio.create_task(self._make_variant(file, dst, width, fmt))
+        task.add_done_callback(lambda _: self._variants.pop(dst, None))
+        return await asyncio.shield(task)
+
+    async def _make_variant(self, file: str, dst: str, width: int, fmt: str) -> str:
+        size = await run_in_pool(make_variant, file, dst, width, fmt)
+        unique_id = ospath.basename(file)[:-len('.jpg')]
+        if unique_id in self.files:
+            self.files[unique_id] += size
+            self.size += size
+            self._schedule_save()
+            await self._evict()
+        return dst
+
+
+class ThumbnailFetcher:
+    """
+    Load thumbnails from Telegram with concurrent requests for one key
+    sharing a single fetch. At most `workers` fetches run at once, spread
+    over the bot clients not in FloodWait, and at most `queue` more wait
+    for a slot. Callers give up after `wait` seconds, leaving the fetch to
+    finish in the background, and get None straight away when the queue is
+    full, so a cold page degrades to fallback images instead of piling up.
+    """
+
+    def __init__(self, workers: int, queue: int, wait: float):
+        self.slots = asyncio.Semaphore(workers)
+        self.queue = queue
+        self.wait = wait
+        self.waiting = 0
+        self.inflight = {}
+        self.jobs = Counter()
+        self.stats = Counter()
+
+    def pick(self) -> int:
+        clients = list(multi_clients) or [0]
+        now = monotonic()
+        ready = [i for i in clients if i not in scheduler.clients or scheduler.flood_until(i) <= now]
+        return min(ready or clients, key=lambda i: self.jobs[i])
+
+    def room(self) -> int:
+        """Fetches that can still be queued before new ones are rejected."""
+        return max(0, self.queue - self.waiting)
+
+    def submit(self, key: str, load: Callable[[int, Client], Awaitable[str]], index: Optional[int] = None) -> Optional[asyncio.Task]:
+        """
+        Start (or join) the fetch for `key` without waiting for it. `index`
+        pins the fetch to one client, for file ids only that bot can use.
+        """
+        if task := self.inflight.get(key):
+            self.stats['shared'] += 1
+            return task
+        if self.waiting >= self.queue:
+            self.stats['rejected'] += 1
+            return None
+        self.waiting += 1
+        task = self.inflight[key] = asyncio.create_task(self._run(load, index))
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def get(self, key: str, load: Callable[[int, Client], Awaitable[str]]) -> Optional[str]:
+        if (task := self.submit(key, load)) is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait)
+        except asyncio.TimeoutError:
+            self.stats['timed_out'] += 1
+            return None
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self.inflight.pop(key, None)
+        if not task.cancelled() and (e := task.exception()) is not None:
+            self.stats['failed'] += 1
+            LOGGER.error(f"Generate Img Error: {e}")
+
+    async def _run(self, load, index: Optional[int]) -> str:
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        if index is None:
+            index = self.pick()
+        self.jobs[index] += 1
+        try:
+            return await load(index, multi_clients.get(index, StreamBot))
+        except FloodWait as e:
+            scheduler.flood(index, e.value)
+            raise
+        finally:
+            self.jobs[index] -= 1
+            self.slots.release()
+
+
+thumbnail_store = ThumbnailStore(THUMB_DIR, Telegram.THUMB_CACHE_SIZE_MB * 1024 * 1024 // max(1, Telegram.WEB_WORKERS))
+thumbnail_fetcher = ThumbnailFetcher(Telegram.THUMB_WORKERS, Telegram.THUMB_QUEUE, Telegram.THUMB_WAIT)
+# Keys known to have no thumbnail, answered with the static fallback.
+missing = OrderedDict()
+
+
+def photo_of(message):
+    """(file_id, file_unique_id) of a message's video thumbnail, or None."""
+    thumbs = message.video.thumbs if message and message.video else None
+    return thumbs and (thumbs[0].file_id, thumbs[0].file_unique_id)
+
+
+async def save_image(client: Client, cache_key: str, photo) -> str:
+    if not photo:
+        missing[cache_key] = True
+        if len(missing) > MISSING_SIZE:
+            missing.popitem(last=False)
+        return path
+    img = await thumbnail_store.fetch(cache_key, *photo, client)
+    await shared_store.set('thumbs', cache_key, photo[1], 7 * 24 * 60 * 60)
+    return img
+
+
+async def load_image(client: Client, cache_key: str, chat_id, message_id, small: bool = False) -> str:
+    if message_id is None:
+        chat = await client.get_chat(int(chat_id))
+        if small:
+            photo = chat.photo and (chat.photo.small_file_id, chat.photo.small_photo_unique_id)
         else:
-            msg = await StreamBot.get_messages(int(chat_id), int(message_id))
-            img = await StreamBot.download_media(str(msg.video.thumbs[0].file_id)) if msg.video else path
+            photo = chat.photo and (chat.photo.big_file_id, chat.photo.big_photo_unique_id)
+    else:
+        photo = photo_of(await client.get_messages(int(chat_id), int(message_id)))
+    return await save_image(client, cache_key, photo)
+
+
+async def prefetch_thumbnails(chat_id: str, message_ids: List[int]) -> None:
+    """
+    Warm the thumbnails of one listing page: a single get_messages call for
+    every id not cached yet, then one queued download per thumbnail on the
+    same client. Lazy-loaded <img> requests join those downloads instead of
+    asking Telegram for their message one by one.
+    """
+    keys = {}
+    for message_id in message_ids:
+        key = f"{chat_id}-{message_id}"
+        if key not in missing and key not in thumbnail_fetcher.inflight and not await thumbnail_store.get(key):
+            keys[int(message_id)] = key
+    pending = list(keys)[:thumbnail_fetcher.room()]
+    if not pending:
+        return
+    index = thumbnail_fetcher.pick()
+    client = multi_clients.get(index, StreamBot)
+    batch = asyncio.ensure_future(client.get_messages(int(chat_id), pending))
+
+    async def load(message_id: int) -> Optional[str]:
+        try:
+            messages = await asyncio.shield(batch)
+        except Exception as e:
+            LOGGER.debug(f"Thumbnail prefetch for {chat_id} failed: {e}")
+            return None
+        message = next((m for m in messages if m.id == message_id), None)
+        return await save_image(client, keys[message_id], photo_of(message))
+
+    for message_id in pending:
+        thumbnail_fetcher.submit(keys[message_id], lambda _index, _client, message_id=message_id: load(message_id), index)
+
 
-        image_cache[cache_key] = img
+def parse_thumb_url(url: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(chat_id, message_id) of a message's /api/thumb/ URL, None for anything else."""
+    parsed = urlparse(url or '')
+    if parsed.path.startswith('/api/thumb/') and (message_id := parse_qs(parsed.query).get('id')):
+        return parsed.path[len('/api/thumb/'):], message_id[0]
+    return None
+
+
+def schedule_prefetch(thumbnails: List[str]) -> None:
+    """Prefetch the /api/thumb/ URLs of a listing page in the background, one batch per chat."""
+    if not Telegram.THUMB_PREFETCH:
+        return
+    chats = {}
+    for url in thumbnails:
+        if thumb := parse_thumb_url(url):
+            chats.setdefault(thumb[0], []).append(thumb[1])
+    for chat_id, message_ids in chats.items():
+        asyncio.create_task(prefetch_thumbnails(chat_id, message_ids))
+
+
+async def get_image(chat_id, message_id, small: bool = False):
+    """
+    Path of the thumbnail for a message or channel, or the static fallback.
+    `small` picks the 160px channel photo, enough for 100px avatar cards.
+    """
+    if message_id:
+        cache_key = f"{chat_id}-{message_id}"
+    else:
+        cache_key = f"{chat_id}-small" if small else f"{chat_id}"
+    if img := await thumbnail_store.get(cache_key):
+        return img
+    if cache_key in missing:
+        return path
+    # Another web worker may already have downloaded it.
+    if (unique_id := await shared_store.get('thumbs', cache_key)) and (img := await thumbnail_store.link(cache_key, unique_id)):
         return img
+    try:
+        img = await thumbnail_fetcher.get(cache_key, lambda index, client: load_image(client, cache_key, chat_id, message_id, small))
+    except Exception:
+        # Already logged by the fetcher.
+        img = None
+    return img or path
+
+
+def variant_format(accept: str) -> str:
+    """Best image format from THUMB_FORMATS that the client's Accept header allows."""
+    for fmt in Telegram.THUMB_FORMATS:
+        if f'image/{fmt}' in accept and features.check(fmt):
+            return fmt
+    return 'jpeg'
+
+
+async def get_variant(img: str, avatar: bool, scale: int, accept: str) -> Tuple[str, str]:
+    """(path, content type) of the card-sized variant of a stored thumbnail, or of `img` itself."""
+    if not Telegram.THUMB_RESIZE or img == path:
+        return img, 'image/jpeg'
+    fmt = variant_format(accept)
+    width = (AVATAR_WIDTH if avatar else Telegram.THUMB_CARD_WIDTH) * scale
+    try:
+        return await thumbnail_store.variant(img, width, fmt), VARIANT_TYPES[fmt]
     except Exception as e:
-        LOGGER.error(f"Generate Img Error: {e}")
-        return
+        LOGGER.warning(f"Could not resize thumbnail {img}: {e}")
+        return img, 'image/jpeg'
+
+
+def card_url(url: str) -> str:
+    """Thumbnail URL for a grid card: resized variants when THUMB_RESIZE is on."""
+    if not Telegram.THUMB_RESIZE or not url.startswith('/api/thumb/'):
+        return url
+    return f"{url}{'&' if '?' in url else '?'}size=card"
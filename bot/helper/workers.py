@@ -0,0 +1,136 @@
+import asyncio
+import os
+import secrets
+import signal
+import sys
+from time import monotonic
+from typing import Awaitable, Callable, Dict
+
+from bot import LOGGER
+from bot.config import Telegram
+from bot.helper.shared_store import shared_store
+from bot.telegram.scheduler import scheduler
+
+LOAD_INTERVAL = 1
+LOAD_TTL = 5
+PURGE_EVERY = 60
+RESTART_DELAY = 5
+STOP_TIMEOUT = 10
+RELAY_POLL = 0.1
+RELAY_TIMEOUT = 30
+
+
+class WorkerSupervisor:
+    """
+    Run WEB_WORKERS - 1 extra copies of the bot as web workers and restart
+    any that exit. Workers bind the same port through SO_REUSEPORT and are
+    told apart by the WORKER_ID environment variable; only worker 0 (this
+    process) runs the plugin handlers.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.procs = {}
+        self.tasks = []
+        self.stopping = False
+
+    def start(self) -> None:
+        for worker_id in range(1, self.count):
+            self.tasks.append(asyncio.create_task(self.supervise(worker_id)))
+
+    async def supervise(self, worker_id: int) -> None:
+        while not self.stopping:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'bot',
+                env={**os.environ, 'WORKER_ID': str(worker_id)}
+            )
+            self.procs[worker_id] = proc
+            LOGGER.info(f"Started web worker {worker_id} (pid {proc.pid})")
+            code = await proc.wait()
+            if self.stopping:
+                return
+            LOGGER.warning(f"Web worker {worker_id} exited with code {code}, restarting in {RESTART_DELAY}s")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def stop(self) -> None:
+        self.stopping = True
+        running = [proc for proc in self.procs.values() if proc.returncode is None]
+        for proc in running:
+            proc.send_signal(signal.SIGINT)
+        for proc in running:
+            try:
+                await asyncio.wait_for(proc.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                proc.kill()
+        for task in self.tasks:
+            task.cancel()
+
+
+async def share_load() -> None:
+    """
+    Publish this worker's per-client load and fold in the other workers',
+    so every worker schedules against the total load on each bot account.
+    Workers also exit on their own if the master goes away.
+    """
+    key = str(Telegram.WORKER_ID)
+    parent = os.getppid()
+    rounds = 0
+    while True:
+        try:
+            await shared_store.set('load', key, scheduler.export(), LOAD_TTL)
+            others = await shared_store.items('load')
+            others.pop(key, None)
+            scheduler.merge(list(others.values()))
+            rounds += 1
+            if Telegram.WORKER_ID == 0 and rounds % PURGE_EVERY == 0:
+                await shared_store.purge()
+        except Exception as e:
+            LOGGER.warning(f"Could not share worker load: {e}")
+        if Telegram.WORKER_ID and os.getppid() != parent:
+            LOGGER.info(f"Master process is gone, stopping web worker {Telegram.WORKER_ID}")
+            os.kill(os.getpid(), signal.SIGINT)
+            return
+        await asyncio.sleep(LOAD_INTERVAL)
+
+
+async def run_on_master(kind: str, *args):
+    """
+    Hand a call only worker 0 can make (UserBot runs there alone, since a
+    user session must not be connected from several processes) to worker 0
+    and wait for its JSON-safe result.
+    """
+    job = secrets.token_hex(8)
+    await shared_store.set('relay_jobs', job, {'kind': kind, 'args': args}, RELAY_TIMEOUT)
+    deadline = monotonic() + RELAY_TIMEOUT
+    while monotonic() < deadline:
+        await asyncio.sleep(RELAY_POLL)
+        if (result := await shared_store.get('relay_results', job)) is not None:
+            await shared_store.delete('relay_results', job)
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            return result['value']
+    await shared_store.delete('relay_jobs', job)
+    raise asyncio.TimeoutError(f"Worker 0 did not answer {kind} in {RELAY_TIMEOUT}s")
+
+
+async def serve_relay(handlers: Dict[str, Callable[..., Awaitable]]) -> None:
+    """Worker 0: run the calls other web workers hand over with run_on_master."""
+
+    async def run(job: str, spec: dict) -> None:
+        try:
+            result = {'value': await handlers[spec['kind']](*spec['args'])}
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        await shared_store.set('relay_results', job, result, RELAY_TIMEOUT)
+
+    while True:
+        try:
+            for job, spec in (await shared_store.items('relay_jobs')).items():
+                await shared_store.delete('relay_jobs', job)
+                asyncio.create_task(run(job, spec))
+        except Exception as e:
+            LOGGER.warning(f"Could not read relayed jobs: {e}")
+        await asyncio.sleep(RELAY_POLL)
+
+
+supervisor = WorkerSupervisor(Telegram.WEB_WORKERS)
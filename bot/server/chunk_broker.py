@@ -0,0 +1,65 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List
+
+from bot.config import Telegram
+
+
+class ChunkBroker:
+    """
+    Share GetFile results between streams reading the same file.
+
+    Concurrent requests for one key wait on a single in-flight fetch, and
+    the most recently fetched parts are kept in a small bounded ring.
+    """
+
+    def __init__(self, max_parts: int):
+        self.max_parts = max_parts
+        self.recent: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.inflight: Dict[Hashable, List] = {}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        chunk = self.recent.get(key)
+        if chunk is not None:
+            self.recent.move_to_end(key)
+            self.hits += 1
+            return chunk
+        entry = self.inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            task = asyncio.create_task(loader())
+            entry = self.inflight[key] = [task, 0]
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            # Only abandon the fetch once every waiting stream has gone away.
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # Unlisted first, so a stream arriving before the task has
+                # finished cancelling starts a fresh fetch instead of joining it.
+                if self.inflight.get(key) is entry:
+                    del self.inflight[key]
+                entry[0].cancel()
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        entry = self.inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self.inflight[key]
+        if task.cancelled() or task.exception() is not None or not task.result():
+            return
+        if self.max_parts <= 0:
+            return
+        self.recent[key] = task.result()
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.max_parts:
+            self.recent.popitem(last=False)
+
+
+chunk_broker = ChunkBroker(Telegram.CHUNK_RING_PARTS)
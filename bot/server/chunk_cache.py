@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Optional
+
+from bot.config import Telegram
+
+
+class ChunkCache:
+    """
+    Persistent on-disk cache of GetFile parts.
+
+    Parts are keyed by file_unique_id, aligned offset and part size, and
+    spread over 256 shard directories. Writes go to a temporary file that
+    is atomically renamed, so a crash never leaves a truncated part behind.
+    Least recently used parts are evicted once the size budget is exceeded.
+    """
+
+    def __init__(self, root: str, max_bytes: int, max_pending_writes: int = 16):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_pending_writes = max_pending_writes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self.pending_writes = 0
+        # Parts being written, so a second store of one part is skipped.
+        self.writing = set()
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, unique_id: str, offset: int, chunk_size: int) -> str:
+        shard = sha1(unique_id.encode()).hexdigest()[:2]
+        return os.path.join(self.root, shard, f"{unique_id}-{offset}-{chunk_size}")
+
+    def _scan(self):
+        entries = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                if not os.path.isfile(path):
+                    # Per-worker subdirectories left from a multi-worker run.
+                    continue
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+                entries.append((st.st_mtime, path, st.st_size))
+        entries.sort()
+        return entries
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            for _, path, size in await asyncio.to_thread(self._scan):
+                self.entries[path] = size
+                self.size += size
+            self._loaded = True
+            logging.info(f"Chunk cache loaded {len(self.entries)} parts ({self.size} bytes)")
+            await self._evict()
+
+    async def get(self, unique_id: str, offset: int, chunk_size: int) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        await self._ensure_loaded()
+        path = self.path(unique_id, offset, chunk_size)
+        if path not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            chunk = await asyncio.to_thread(self._read, path)
+        except OSError:
+            self._forget(path)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return chunk
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        # mtime doubles as the LRU clock when the index is rebuilt on start.
+        os.utime(path)
+        return data
+
+    @staticmethod
+    def _write(path: str, chunk: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def store(self, unique_id: str, offset: int, chunk_size: int, chunk: bytes) -> None:
+        """Write a part back in the background, dropping it if the disk is falling behind."""
+        if not self.enabled or not chunk or self.pending_writes >= self.max_pending_writes:
+            return
+        self.pending_writes += 1
+        asyncio.create_task(self._store(self.path(unique_id, offset, chunk_size), bytes(chunk)))
+
+    async def _store(self, path: str, chunk: bytes) -> None:
+        claimed = False
+        try:
+            await self._ensure_loaded()
+            if path in self.entries or path in self.writing:
+                return
+            self.writing.add(path)
+            claimed = True
+            await asyncio.to_thread(self._write, path, chunk)
+            self.entries[path] = len(chunk)
+            self.size += len(chunk)
+            await self._evict()
+        except OSError as e:
+            logging.warning(f"Could not write chunk cache entry {path}: {e}")
+        finally:
+            if claimed:
+                self.writing.discard(path)
+            self.pending_writes -= 1
+
+    def _forget(self, path: str) -> None:
+        self.size -= self.entries.pop(path, 0)
+
+    async def _evict(self) -> None:
+        victims = []
+        while self.size > self.max_bytes and self.entries:
+            path, size = self.entries.popitem(last=False)
+            self.size -= size
+            victims.append(path)
+        if victims:
+            await asyncio.to_thread(self._remove, victims)
+
+    @staticmethod
+    def _remove(paths) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def worker_cache() -> ChunkCache:
+    """
+    With several web workers each gets its own subdirectory and an equal
+    share of the budget, so their scans and evictions never touch each
+    other's files and the total stays within CHUNK_CACHE_SIZE_MB.
+    """
+    max_bytes = Telegram.CHUNK_CACHE_SIZE_MB * 1024 * 1024
+    if Telegram.WEB_WORKERS > 1:
+        return ChunkCache(os.path.join(Telegram.CHUNK_CACHE_DIR, f"worker{Telegram.WORKER_ID}"), max_bytes // Telegram.WEB_WORKERS)
+    return ChunkCache(Telegram.CHUNK_CACHE_DIR, max_bytes)
+
+
+chunk_cache = worker_cache()
@@ -1,106 +1,255 @@
 import asyncio
 import logging
+from collections import Counter, deque
+from time import monotonic
 from pyrogram import utils, raw
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import FileReferenceExpired, FloodWait
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
-from pyrogram.session import Session, Auth
-from typing import Dict, Union
+from pyrogram.session import Session
+from typing import List, Optional, Tuple, Union
+from bot.config import Telegram
+from bot.helper.cache import AsyncLRUCache
 from bot.helper.exceptions import FIleNotFound
-from bot.server.file_properties import get_file_ids
-from bot.telegram import work_loads
+from bot.helper.shared_store import shared_store
+from bot.server.chunk_broker import chunk_broker
+from bot.server.chunk_cache import chunk_cache
+from bot.server.file_properties import decode_file_properties, encode_file_properties, get_file_ids
+from bot.server.session_pool import session_pool
+from bot.telegram.scheduler import scheduler
 from pyrogram import Client, utils, raw
 
 
+MIN_CHUNK_SIZE = 4 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def get_chunk_size(from_bytes: int, until_bytes: int) -> int:
+    """
+    Pick the GetFile limit for a byte range.
+
+    Telegram requires the limit to be a multiple of 4 KiB that divides
+    1 MiB, and a part may not cross a 1 MiB boundary, so only powers of two
+    between 4 KiB and 1 MiB are valid. Short ranges (player probes, moov
+    lookups) get the smallest such size covering them in at most two
+    parts; anything of 1 MiB or more uses full-size parts.
+    """
+    req_length = until_bytes - from_bytes + 1
+    chunk_size = MIN_CHUNK_SIZE
+    while chunk_size < req_length and chunk_size < MAX_CHUNK_SIZE:
+        chunk_size *= 2
+    return chunk_size
+
+
+class BufferBudget:
+    """Byte budget shared by every stream for read-ahead parts."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def try_acquire(self, size: int) -> bool:
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def release(self, size: int) -> None:
+        self.used -= size
+
+
+buffer_budget = BufferBudget(Telegram.STREAM_GLOBAL_BUFFER_MB * 1024 * 1024)
+stream_stats = Counter()
+
+
 class ByteStreamer:
     def __init__(self, client: Client):
-        self.clean_timer = 30 * 60
         self.client: Client = client
-        self.__cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
+        self.cached_file_ids = AsyncLRUCache(Telegram.FILE_CACHE_SIZE, Telegram.FILE_CACHE_TTL)
+        self.refresh_lock = asyncio.Lock()
 
     async def get_file_properties(self, chat_id: int, message_id: int) -> FileId:
-        if message_id not in self.__cached_file_ids:
-            file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
-            if not file_id:
-                logging.info('Message with ID %s not found!', message_id)
-                raise FIleNotFound
-            self.__cached_file_ids[message_id] = file_id
-        return self.__cached_file_ids[message_id]
-
-    async def yield_file(self, file_id: FileId, index: int, offset: int, first_part_cut: int, last_part_cut: int, part_count: int, chunk_size: int) -> Union[str, None]: # type: ignore
-        client = self.client
-        work_loads[index] += 1
-        logging.debug(f"Starting to yielding file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
-        current_part = 1
-        location = await self.get_location(file_id)
-        try:
-            r = await media_session.send(raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size))
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
+        return await self.cached_file_ids.get((int(chat_id), int(message_id)), lambda: self.load_file_properties(chat_id, message_id))
 
-                    current_part += 1
-                    offset += chunk_size
+    def shared_key(self, chat_id: int, message_id: int) -> str:
+        # file_ids only work for the bot account that received them; session
+        # names differ between workers running the same token.
+        return f"{self.client.me.id}:{chat_id}:{message_id}"
 
-                    if current_part > part_count:
-                        break
+    async def load_file_properties(self, chat_id: int, message_id: int) -> FileId:
+        key = self.shared_key(int(chat_id), int(message_id))
+        if shared := await shared_store.get('file_ids', key):
+            return decode_file_properties(shared)
+        file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
+        if not file_id:
+            logging.info('Message with ID %s not found!', message_id)
+            raise FIleNotFound
+        await shared_store.set('file_ids', key, encode_file_properties(file_id), Telegram.FILE_CACHE_TTL)
+        return file_id
 
-                    r = await media_session.send(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
-        except (TimeoutError, AttributeError):
-            pass
-        finally:
-            logging.debug("Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
+    async def refresh_file_reference(self, file_id: FileId, stale_reference: bytes) -> bool:
+        """
+        Refetch the message behind `file_id` and update its file reference in
+        place. Returns False if another request already refreshed it.
+        """
+        async with self.refresh_lock:
+            if file_id.file_reference != stale_reference:
+                return False
+            key = (file_id.message_chat_id, file_id.message_id)
+            logging.info(f"File reference expired for message {key}, refreshing")
+            self.cached_file_ids.invalidate(key)
+            await shared_store.delete('file_ids', self.shared_key(*key))
+            fresh = await self.get_file_properties(*key)
+            # Streams still holding the old FileId pick up the new reference too.
+            file_id.file_reference = fresh.file_reference
+            return True
 
-    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
-        media_session = client.media_sessions.get(file_id.dc_id, None)
-        if media_session is None:
-            if file_id.dc_id != await client.storage.dc_id():
-                media_session = Session(client,
-                                        file_id.dc_id,
-                                        await Auth(client, file_id.dc_id, await client.storage.test_mode()).create(),
-                                        await client.storage.test_mode(),
-                                        is_media=True)
-                await media_session.start()
-                for _ in range(6):
-                    exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id))
-                    try:
-                        await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
-                        break
-                    except AuthBytesInvalid:
-                        logging.debug(
-                            'Invalid authorization bytes for DC %s!', file_id.dc_id)
+    async def get_part(self, media_session: Session, location, offset: int, chunk_size: int) -> bytes:
+        r = await media_session.send(raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size))
+        if isinstance(r, raw.types.upload.File):
+            return r.bytes
+        return b''
+
+    async def yield_file(self, file_id: FileId, index: int, offset: int, first_part_cut: int, last_part_cut: int, part_count: int, chunk_size: int, stripes: Optional[List[Tuple[int, "ByteStreamer", FileId]]] = None) -> Union[str, None]: # type: ignore
+        """
+        Yield the requested parts in order while keeping up to STREAM_PREFETCH
+        GetFile requests in flight. Read-ahead beyond the next part is only
+        issued when the per-stream and global buffer budgets allow it.
+
+        When `stripes` is given, parts are spread round-robin across those
+        (client index, ByteStreamer, FileId) sources instead of this client.
+        """
+        stripes = stripes or [(index, self, file_id)]
+        logging.debug(f"Starting to yielding file with clients {[i for i, _, _ in stripes]}.")
+        sources = []
+        # Bytes each source still has to fetch for this stream. Parts are
+        # charged to the source that fetches them, sources[part % len(sources)],
+        # and re-split whenever a source drops out.
+        owed = {}
+
+        def backlog() -> dict:
+            due = dict.fromkeys((i for i, _, _, _ in sources), 0)
+            for part in range(current_part, part_count + 1):
+                due[sources[part % len(sources)][0]] += chunk_size
+            return due
+
+        async def fetch(part: int, part_offset: int) -> bytes:
+            return await chunk_broker.get((file_id.media_id, part_offset, chunk_size), lambda: fetch_cached(part, part_offset))
+
+        async def fetch_cached(part: int, part_offset: int) -> bytes:
+            unique_id = getattr(file_id, 'unique_id', None)
+            if unique_id and (chunk := await chunk_cache.get(unique_id, part_offset, chunk_size)) is not None:
+                return chunk
+            chunk = await fetch_from_source(part, part_offset)
+            if unique_id:
+                chunk_cache.store(unique_id, part_offset, chunk_size, chunk)
+            return chunk
+
+        ref_retries = Telegram.FILE_REF_RETRIES
+
+        async def fetch_from_source(part: int, part_offset: int) -> bytes:
+            nonlocal ref_retries
+            while True:
+                source = sources[part % len(sources)]
+                i, streamer, media_session, fid = source
+                file_reference = fid.file_reference
+                started = monotonic()
+                try:
+                    chunk = await streamer.get_part(media_session, await streamer.get_location(fid), part_offset, chunk_size)
+                    scheduler.record(i, len(chunk), monotonic() - started)
+                    return chunk
+                except FileReferenceExpired:
+                    stream_stats['file_ref_expired'] += 1
+                    if fid.file_reference != file_reference:
                         continue
+                    if ref_retries <= 0:
+                        stream_stats['file_ref_failed'] += 1
+                        raise
+                    if await streamer.refresh_file_reference(fid, file_reference):
+                        ref_retries -= 1
+                        stream_stats['file_ref_refreshed'] += 1
+                except FloodWait as e:
+                    scheduler.flood(i, e.value)
+                    if len(sources) > 1:
+                        if source in sources:
+                            logging.info(f"Client {i} hit FloodWait of {e.value}s, dropping it from the stripe")
+                            sources.remove(source)
+                            scheduler.finish(i, owed.pop(i))
+                            for j, amount in backlog().items():
+                                scheduler.charge(j, amount - owed[j])
+                                owed[j] = amount
+                    elif e.value <= Telegram.SLEEP_THRESHOLD:
+                        await asyncio.sleep(e.value)
+                    else:
+                        raise
+                except Exception:
+                    scheduler.error(i)
+                    raise
+
+        current_part = 1
+        pending = deque()
+        next_part, next_offset = 1, offset
+        try:
+            for i, streamer, fid in stripes:
+                try:
+                    sources.append((i, streamer, await streamer.generate_media_session(streamer.client, fid), fid))
+                except Exception:
+                    if i == index:
+                        raise
+                    logging.warning(f"Client {i} could not open a media session, skipping it for this stream", exc_info=True)
+            owed = backlog()
+            for i, amount in owed.items():
+                scheduler.start(i, amount)
+            depth = Telegram.STREAM_PREFETCH * len(sources)
+            depth = max(1, min(depth, (Telegram.STREAM_BUFFER_MB * 1024 * 1024) // chunk_size))
+            while current_part <= part_count:
+                while next_part <= part_count and (not pending or (len(pending) < depth and buffer_budget.try_acquire(chunk_size))):
+                    reserved = chunk_size if pending else 0
+                    pending.append((asyncio.create_task(fetch(next_part, next_offset)), reserved))
+                    next_part += 1
+                    next_offset += chunk_size
+                task, reserved = pending.popleft()
+                try:
+                    chunk = await task
+                finally:
+                    buffer_budget.release(reserved)
+                if not chunk:
+                    break
+                # memoryview slices hand the reply buffer on without copying it.
+                elif part_count == 1:
+                    yield memoryview(chunk)[first_part_cut:last_part_cut]
+                elif current_part == 1:
+                    yield memoryview(chunk)[first_part_cut:]
+                elif current_part == part_count:
+                    yield memoryview(chunk)[:last_part_cut]
                 else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
-            else:
-                media_session = Session(client,
-                                        file_id.dc_id,
-                                        await client.storage.auth_key(),
-                                        await client.storage.test_mode(),
-                                        is_media=True)
-                await media_session.start()
-            logging.debug(f"Created media session for DC {file_id.dc_id}")
-            client.media_sessions[file_id.dc_id] = media_session
-        else:
-            logging.debug(f"Using cached media session for DC {file_id.dc_id}")
-        return media_session
+                    yield chunk
+                owner = sources[current_part % len(sources)][0]
+                owed[owner] -= chunk_size
+                scheduler.release(owner, chunk_size)
+                current_part += 1
+        finally:
+            for task, reserved in pending:
+                if not task.done():
+                    task.cancel()
+                    stream_stats['cancelled_parts'] += 1
+                elif not task.cancelled() and task.exception() is None:
+                    stream_stats['undelivered_bytes'] += len(task.result())
+                buffer_budget.release(reserved)
+            logging.debug(f"Finished yielding file with {current_part - 1} parts.")
+            for i, amount in owed.items():
+                scheduler.finish(i, amount)
+
+    def stream_range(self, file_id: FileId, index: int, from_bytes: int, until_bytes: int, stripes: Optional[List[Tuple[int, "ByteStreamer", FileId]]] = None):
+        """yield_file for the inclusive byte range [from_bytes, until_bytes]."""
+        chunk_size = get_chunk_size(from_bytes, until_bytes)
+        offset = from_bytes - (from_bytes % chunk_size)
+        first_part_cut = from_bytes - offset
+        last_part_cut = until_bytes % chunk_size + 1
+        part_count = until_bytes // chunk_size - offset // chunk_size + 1
+        return self.yield_file(file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size, stripes)
+
+    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
+        return await session_pool.get(client, file_id.dc_id)
 
     @staticmethod
     async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation, raw.types.InputDocumentFileLocation, raw.types.InputPeerPhotoFileLocation]:
@@ -130,12 +279,3 @@ class ByteStreamer:
                                                            file_reference=file_id.file_reference,
                                                            thumb_size=file_id.thumbnail_size)
         return location
-
-    async def clean_cache(self) -> None:
-        """
-        function to clean the cache to reduce memory usage
-        """
-        while True:
-            await asyncio.sleep(self.clean_timer)
-            self.__cached_file_ids.clear()
-            logging.debug("Cleaned the cache")
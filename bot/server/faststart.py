@@ -0,0 +1,90 @@
+import asyncio
+import struct
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from bot.config import Telegram
+from bot.helper.cache import AsyncLRUCache
+from bot.server.media_index import get_index, get_moov, iter_boxes
+
+# Boxes on the path from moov down to the chunk offset tables.
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+patched_moovs = AsyncLRUCache(Telegram.MOOV_CACHE_SIZE, 24 * 60 * 60)
+
+# (virtual offset, length, bytes held in memory or None, source offset in the original file)
+Piece = Tuple[int, int, Optional[bytes], int]
+
+
+def patch_moov(moov: bytes, insert_at: int, moov_offset: int) -> Optional[bytes]:
+    """
+    Copy of `moov` with every chunk offset in [insert_at, moov_offset)
+    moved forward by the moov size, as if the moov had been written at
+    `insert_at`. Returns None when a 32-bit stco offset would overflow.
+    """
+    data = bytearray(moov)
+    shift = len(moov)
+
+    def walk(start: int, end: int) -> bool:
+        for kind, s, e in iter_boxes(data, start, end):
+            if kind in CONTAINERS:
+                if not walk(s, e):
+                    return False
+            elif kind in (b"stco", b"co64"):
+                fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+                count = struct.unpack_from(">I", data, s + 4)[0]
+                for pos in range(s + 8, min(e, s + 8 + count * width), width):
+                    offset = struct.unpack_from(fmt, data, pos)[0]
+                    if insert_at <= offset < moov_offset:
+                        offset += shift
+                        if width == 4 and offset > 0xFFFFFFFF:
+                            return False
+                        struct.pack_into(fmt, data, pos, offset)
+        return True
+
+    return bytes(data) if walk(0, len(data)) else None
+
+
+async def get_layout(streamer, file_id, index: int) -> Optional[List[Piece]]:
+    """
+    Pieces of a virtual faststart copy of an MP4 whose moov follows the
+    mdat: everything before the mdat, the patched moov, then the rest of
+    the file without the original moov. The total size is unchanged.
+    None when the file is not an MP4 that needs it or cannot be patched.
+    """
+    media = await get_index(streamer, file_id, index)
+    if media["container"] != "mp4" or media.get("faststart") or not media.get("moov") or not media.get("mdat"):
+        return None
+    if any(kind == "moof" for kind, _, _ in media["boxes"]):
+        return None
+    moov_offset, moov_size = media["moov"]
+    insert_at = media["mdat"][0]
+    if moov_offset < insert_at or (moov := await get_moov(streamer, file_id, index, media)) is None:
+        return None
+    patched = await patched_moovs.get(file_id.unique_id, lambda: asyncio.to_thread(patch_moov, moov, insert_at, moov_offset))
+    if patched is None:
+        return None
+    moov_end = moov_offset + moov_size
+    pieces = [
+        (0, insert_at, None, 0),
+        (insert_at, moov_size, patched, 0),
+        (insert_at + moov_size, moov_offset - insert_at, None, insert_at),
+        (moov_end, file_id.file_size - moov_end, None, moov_end),
+    ]
+    return [piece for piece in pieces if piece[1] > 0]
+
+
+async def open_range(streamer, file_id, index: int, layout: List[Piece], start: int, end: int) -> AsyncGenerator:
+    """Yield the inclusive virtual byte range [start, end], fetching file pieces through ByteStreamer."""
+    for virtual, length, data, source in layout:
+        lo, hi = max(start, virtual), min(end, virtual + length - 1)
+        if lo > hi:
+            continue
+        if data is not None:
+            yield memoryview(data)[lo - virtual:hi - virtual + 1]
+            continue
+        body = streamer.stream_range(file_id, index, source + lo - virtual, source + hi - virtual)
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await body.aclose()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pyrogram.file_id import FileId
 from typing import Optional
 from bot.helper.exceptions import FIleNotFound
@@ -17,4 +18,31 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     setattr(file_id, 'file_size', getattr(media, 'file_size', 0))
     setattr(file_id, 'mime_type', getattr(media, 'mime_type', ''))
     setattr(file_id, 'unique_id', file_unique_id)
+    setattr(file_id, 'message_chat_id', chat_id)
+    setattr(file_id, 'message_id', message_id)
+    setattr(file_id, 'date', message.edit_date or message.date)
+    return file_id
+
+
+def encode_file_properties(file_id: FileId) -> dict:
+    """JSON-safe form of a FileId from get_file_ids, for sharing between web workers."""
+    return {
+        'file_id': file_id.encode(),
+        'file_name': file_id.file_name,
+        'file_size': file_id.file_size,
+        'mime_type': file_id.mime_type,
+        'unique_id': file_id.unique_id,
+        'message_chat_id': file_id.message_chat_id,
+        'message_id': file_id.message_id,
+        'date': file_id.date.isoformat() if file_id.date else None,
+    }
+
+
+def decode_file_properties(data: dict) -> FileId:
+    file_id = FileId.decode(data['file_id'])
+    for key, value in data.items():
+        if key != 'file_id':
+            setattr(file_id, key, value)
+    if file_id.date:
+        file_id.date = datetime.fromisoformat(file_id.date)
     return file_id
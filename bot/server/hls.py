@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import math
+import os
+from hashlib import sha1
+from typing import List, Optional
+
+from bot.config import Telegram
+from bot.helper.cache import AsyncLRUCache, prune_files
+from bot.server.shaper import INTERNAL_TOKEN
+
+INDEX_DIR = os.path.join("cache", "hls")
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+segment_indexes = AsyncLRUCache(512, 24 * 60 * 60)
+segment_jobs = asyncio.Semaphore(Telegram.HLS_MAX_JOBS)
+
+
+def source_url(chat_id: str, message_id: int, secure_hash: str) -> str:
+    """Loopback URL of the progressive stream, so ffmpeg reads through media_streamer unshaped."""
+    return f"http://127.0.0.1:{Telegram.PORT}/{str(chat_id).replace('-100', '')}/video?id={message_id}&hash={secure_hash}&internal={INTERNAL_TOKEN}"
+
+
+async def probe_duration(url: str) -> float:
+    proc = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'quiet',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        url,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=30)
+    return float(stdout.decode().strip())
+
+
+def plan_segments(duration: float, target: float, keyframes: Optional[List[List[float]]] = None) -> List[List[float]]:
+    """
+    [start, duration] pairs of roughly `target` seconds. With a keyframe
+    index every segment starts on a keyframe, so a stream-copy cut never
+    has to begin at the previous GOP and segments don't overlap.
+    """
+    if not keyframes:
+        count = max(1, math.ceil(duration / target))
+        return [[i * target, min(target, duration - i * target)] for i in range(count)]
+    cuts = [0.0]
+    for time, _ in keyframes:
+        if time - cuts[-1] >= target and duration - time >= 1:
+            cuts.append(time)
+    cuts.append(duration)
+    return [[start, end - start] for start, end in zip(cuts, cuts[1:])]
+
+
+async def build_index(unique_id: str, url: str, media: Optional[dict] = None) -> dict:
+    media = media or {}
+    path = os.path.join(INDEX_DIR, f"{unique_id}.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            index = json.load(f)
+        # mtime is the LRU clock prune_files evicts by.
+        os.utime(path)
+        # A plan made without keyframes is replaced once they are known.
+        if index.get("keyframes") or not media.get("keyframes"):
+            return index
+    duration = media.get("duration") or await probe_duration(url)
+    keyframes = media.get("keyframes")
+    index = {"duration": duration, "keyframes": bool(keyframes), "segments": plan_segments(duration, Telegram.HLS_SEGMENT_SECONDS, keyframes)}
+    plan_version(index)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{path}.tmp", path)
+    await asyncio.to_thread(prune_files, INDEX_DIR, Telegram.INDEX_CACHE_FILES)
+    logging.info(f"Built HLS index for {unique_id}: {len(index['segments'])} segments")
+    return index
+
+
+async def get_index(unique_id: str, url: str, media: Optional[dict] = None) -> dict:
+    """Segment plan for a file, computed once per file_unique_id and kept on disk."""
+    cached = segment_indexes.peek(unique_id)
+    if cached is not None and not cached.get("keyframes") and media and media.get("keyframes"):
+        segment_indexes.invalidate(unique_id)
+    return await segment_indexes.get(unique_id, lambda: build_index(unique_id, url, media))
+
+
+def plan_version(index: dict) -> str:
+    """
+    Digest of a plan's segment boundaries. It is part of every segment URL,
+    so a plan rebuilt once keyframes are known never shares cached segments
+    with the one it replaces.
+    """
+    if "version" not in index:
+        index["version"] = sha1(json.dumps(index["segments"]).encode()).hexdigest()[:10]
+    return index["version"]
+
+
+def render_playlist(index: dict, query: str) -> str:
+    segments = index["segments"]
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{math.ceil(max(duration for _, duration in segments))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    version = plan_version(index)
+    for number, (_, duration) in enumerate(segments):
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"{version}/{number}.ts?{query}")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+async def cut_segment(url: str, start: float, duration: float) -> bytes:
+    """
+    An MPEG-TS segment remuxed by ffmpeg from the progressive stream. The
+    whole segment is buffered so a failed cut raises instead of reaching
+    the client as a truncated, immutably cached segment.
+    """
+    async with segment_jobs:
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-v', 'error', '-nostdin',
+            '-ss', f'{start:.3f}', '-i', url, '-t', f'{duration:.3f}',
+            '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy',
+            '-muxdelay', '0', '-output_ts_offset', f'{start:.3f}',
+            '-f', 'mpegts', 'pipe:1',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            data, error = await proc.communicate()
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+    if proc.returncode != 0 or not data:
+        raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {error.decode(errors='replace').strip()[-500:]}")
+    return data
@@ -0,0 +1,90 @@
+from typing import AsyncGenerator, Callable, List, Optional, Tuple
+
+# More ranges than this in one request are treated as no Range at all.
+MAX_RANGES = 16
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse an RFC 7233 `Range` header into inclusive (start, end) pairs.
+
+    Supports closed (`a-b`), open (`a-`) and suffix (`-n`) ranges, in any
+    number. Returns None when the header is absent or malformed and should
+    be ignored, and an empty list when nothing in it is satisfiable.
+    """
+    if not range_header:
+        return None
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        first, sep, last = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else max(start, file_size - 1)
+                if end < start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, file_size - suffix), file_size - 1
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start >= file_size:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def part_header(boundary: str, content_type: str, start: int, end: int, file_size: int) -> bytes:
+    return (f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n").encode()
+
+
+def multipart_length(boundary: str, content_type: str, ranges: List[Tuple[int, int]], file_size: int) -> int:
+    length = len(f"--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(part_header(boundary, content_type, start, end, file_size)) + end - start + 1 + 2
+    return length
+
+
+async def multipart_body(boundary: str, content_type: str, ranges: List[Tuple[int, int]], file_size: int,
+                         open_range: Callable[[int, int], AsyncGenerator]) -> AsyncGenerator:
+    """Yield a multipart/byteranges body, opening each sub-range only when it is reached."""
+    for start, end in ranges:
+        yield part_header(boundary, content_type, start, end, file_size)
+        body = open_range(start, end)
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await body.aclose()
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """Whether an If-None-Match / If-Range style header lists `etag`."""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,402 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+from typing import List, Optional
+
+from bot.config import Telegram
+from bot.helper.cache import AsyncLRUCache, prune_files
+
+INDEX_DIR = os.path.join("cache", "index")
+HEAD_SIZE = 64 * 1024
+MAX_TOP_BOXES = 64
+MIN_KEYFRAME_GAP = 0.5
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+# Matroska element IDs, marker bits included.
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_CLUSTER = 0x1F43B675
+MKV_CUES = 0x1C53BB6B
+MKV_CUE_POINT = 0xBB
+MKV_CUE_TIME = 0xB3
+MKV_CUE_TRACK_POSITIONS = 0xB7
+MKV_CUE_CLUSTER_POSITION = 0xF1
+
+media_indexes = AsyncLRUCache(Telegram.FILE_CACHE_SIZE, 24 * 60 * 60)
+moov_cache = AsyncLRUCache(Telegram.MOOV_CACHE_SIZE, 24 * 60 * 60)
+warming = set()
+
+
+async def read_range(streamer, file_id, index: int, start: int, end: int) -> bytes:
+    return b"".join([bytes(chunk) async for chunk in streamer.stream_range(file_id, index, start, end)])
+
+
+async def iter_bytes(data):
+    """Async body for a range already held in memory."""
+    yield data
+
+
+def iter_boxes(data, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload start, end) for the MP4 boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def find_box(data, start: int, end: int, kind: bytes):
+    for box, s, e in iter_boxes(data, start, end):
+        if box == kind:
+            return s, e
+    return None
+
+
+def unpack_table(data, box, fmt: str, skip: int = 0) -> list:
+    """Entries of a full box laid out as a 32-bit count followed by `fmt` records."""
+    if box is None:
+        return []
+    start = box[0] + 4 + skip
+    count = struct.unpack_from(">I", data, start)[0]
+    return list(struct.iter_unpack(fmt, data[start + 4:start + 4 + count * struct.calcsize(fmt)]))
+
+
+def parse_header_times(data, start: int):
+    """(timescale, duration) of an mvhd or mdhd box."""
+    if data[start] == 1:
+        return struct.unpack_from(">IQ", data, start + 20)
+    return struct.unpack_from(">II", data, start + 12)
+
+
+def sample_offsets(sync: List[int], stsc: list, sizes: list, default_size: int, chunk_offsets: list) -> List[int]:
+    """File offsets of the given (sorted, 1-based) sample numbers."""
+    offsets = []
+    pending = iter(sync)
+    wanted = next(pending, None)
+    sample = 1
+    for run, (first_chunk, per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[run + 1][0] if run + 1 < len(stsc) else len(chunk_offsets) + 1
+        for chunk in range(first_chunk, last_chunk):
+            if wanted is None:
+                return offsets
+            if wanted < sample + per_chunk:
+                pos, current = chunk_offsets[chunk - 1], sample
+                while wanted is not None and wanted < sample + per_chunk:
+                    pos += default_size * (wanted - current) if default_size else sum(sizes[current - 1:wanted - 1])
+                    offsets.append(pos)
+                    current, wanted = wanted, next(pending, None)
+            sample += per_chunk
+    return offsets
+
+
+def run_values(samples: List[int], runs: list, cumulative: bool) -> List[int]:
+    """
+    Per-sample values of stts/ctts style (count, value) runs, either the
+    running sum of values before each sample or the value itself.
+    """
+    values = []
+    runs = iter(runs)
+    first, base = 1, 0
+    count, value = next(runs, (0, 0))
+    for sample in samples:
+        while count and sample >= first + count:
+            base += count * value
+            first += count
+            count, value = next(runs, (0, 0))
+        values.append(base + (sample - first) * value if cumulative else value)
+    return values
+
+
+def parse_track(moov: bytes, start: int, end: int) -> Optional[List[List[float]]]:
+    """Keyframes of a video trak as [presentation time, byte offset] pairs."""
+    mdia = find_box(moov, start, end, b"mdia")
+    if not mdia:
+        return None
+    hdlr = find_box(moov, *mdia, b"hdlr")
+    if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+        return None
+    mdhd = find_box(moov, *mdia, b"mdhd")
+    minf = find_box(moov, *mdia, b"minf")
+    stbl = minf and find_box(moov, *minf, b"stbl")
+    if not mdhd or not stbl:
+        return None
+    timescale = parse_header_times(moov, mdhd[0])[0] or 1
+
+    shift = 0
+    edts = find_box(moov, start, end, b"edts")
+    elst = edts and find_box(moov, *edts, b"elst")
+    if elst:
+        fmt = ">QqI" if moov[elst[0]] == 1 else ">IiI"
+        shift = next((media_time for _, media_time, _ in unpack_table(moov, elst, fmt) if media_time >= 0), 0)
+
+    box = lambda kind: find_box(moov, *stbl, kind)
+    stsz = box(b"stsz")
+    if not stsz:
+        return None
+    default_size, sample_count = struct.unpack_from(">II", moov, stsz[0] + 4)
+    sizes = [] if default_size else [size for size, in unpack_table(moov, stsz, ">I", skip=4)]
+    if co64 := box(b"co64"):
+        chunk_offsets = [offset for offset, in unpack_table(moov, co64, ">Q")]
+    else:
+        chunk_offsets = [offset for offset, in unpack_table(moov, box(b"stco"), ">I")]
+    stss = box(b"stss")
+    sync = sorted(n for n, in unpack_table(moov, stss, ">I")) if stss else list(range(1, sample_count + 1))
+
+    offsets = sample_offsets(sync, unpack_table(moov, box(b"stsc"), ">III"), sizes, default_size, chunk_offsets)
+    dts = run_values(sync, unpack_table(moov, box(b"stts"), ">II"), cumulative=True)
+    ctts = run_values(sync, unpack_table(moov, box(b"ctts"), ">Ii"), cumulative=False)
+    keyframes = []
+    for decode, composition, offset in zip(dts, ctts, offsets):
+        time = max(0.0, (decode + composition - shift) / timescale)
+        if not keyframes or time >= keyframes[-1][0] + MIN_KEYFRAME_GAP:
+            keyframes.append([round(time, 3), offset])
+    return keyframes
+
+
+def parse_moov(moov: bytes) -> dict:
+    """Duration and video keyframes from a complete moov box."""
+    duration, keyframes = None, []
+    for kind, start, end in iter_boxes(moov):
+        if kind != b"moov":
+            continue
+        for kind, s, e in iter_boxes(moov, start, end):
+            if kind == b"mvhd":
+                timescale, length = parse_header_times(moov, s)
+                duration = length / timescale if timescale else None
+            elif kind == b"trak" and not keyframes:
+                keyframes = parse_track(moov, s, e) or []
+    return {"duration": duration, "keyframes": keyframes}
+
+
+async def scan_boxes(read, size: int, head: bytes) -> list:
+    """Top-level MP4 boxes as [type, offset, size], reading only their headers."""
+    boxes = []
+    pos = 0
+    while pos < size and len(boxes) < MAX_TOP_BOXES:
+        header = head[pos:pos + 16] if pos + 16 <= len(head) else await read(pos, min(pos + 15, size - 1))
+        if len(header) < 8:
+            break
+        box_size, kind = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if box_size == 1 and len(header) >= 16:
+            box_size, header_size = struct.unpack_from(">Q", header, 8)[0], 16
+        elif box_size == 0:
+            box_size = size - pos
+        if box_size < header_size:
+            break
+        boxes.append([kind.decode("latin-1"), pos, box_size])
+        pos += box_size
+    return boxes
+
+
+async def probe_mp4(read, unique_id: str, size: int, head: bytes) -> dict:
+    boxes = await scan_boxes(read, size, head)
+    moov = next(([offset, length] for kind, offset, length in boxes if kind == "moov"), None)
+    mdat = next(([offset, length] for kind, offset, length in boxes if kind == "mdat"), None)
+    media = {"container": "mp4", "boxes": boxes, "moov": moov, "mdat": mdat,
+             "faststart": bool(moov and mdat and moov[0] < mdat[0])}
+    if moov and moov[1] <= Telegram.MOOV_MAX_MB * 1024 * 1024:
+        data = moov_cache.peek(unique_id) or await read(moov[0], moov[0] + moov[1] - 1)
+        moov_cache.set(unique_id, data)
+        try:
+            media.update(await asyncio.to_thread(parse_moov, data))
+        except (struct.error, IndexError, TypeError) as e:
+            logging.warning(f"Could not parse moov of {unique_id}: {e}")
+    return media
+
+
+def read_vint(data, pos: int, keep_marker: bool = False):
+    first = data[pos]
+    length, mask = 1, 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("invalid EBML integer")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = value << 8 | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = None
+    return value, pos + length
+
+
+def iter_elements(data, start: int, end: int):
+    """Yield (id, payload start, payload end) for EBML elements that fit in data[start:end]."""
+    pos = start
+    while pos < end:
+        try:
+            element, pos = read_vint(data, pos, keep_marker=True)
+            size, pos = read_vint(data, pos)
+        except (ValueError, IndexError):
+            return
+        stop = end if size is None else pos + size
+        if stop > end:
+            return
+        yield element, pos, stop
+        pos = stop
+
+
+def parse_cues(data, start: int, end: int, segment: int, scale: int) -> List[List[float]]:
+    keyframes = []
+    for element, s, e in iter_elements(data, start, end):
+        if element != MKV_CUE_POINT:
+            continue
+        time = position = None
+        for child, cs, ce in iter_elements(data, s, e):
+            if child == MKV_CUE_TIME:
+                time = int.from_bytes(data[cs:ce], "big") * scale / 1e9
+            elif child == MKV_CUE_TRACK_POSITIONS and position is None:
+                for field, fs, fe in iter_elements(data, cs, ce):
+                    if field == MKV_CUE_CLUSTER_POSITION:
+                        position = segment + int.from_bytes(data[fs:fe], "big")
+        if time is not None and position is not None and (not keyframes or time >= keyframes[-1][0] + MIN_KEYFRAME_GAP):
+            keyframes.append([round(time, 3), position])
+    return keyframes
+
+
+async def probe_matroska(read, size: int, head: bytes) -> dict:
+    media = {"container": "matroska", "duration": None, "keyframes": []}
+    try:
+        _, _, ebml_end = next(iter_elements(head, 0, len(head)))
+        element, pos = read_vint(head, ebml_end, keep_marker=True)
+        _, segment = read_vint(head, pos)
+    except (StopIteration, ValueError, IndexError):
+        return media
+    if element != MKV_SEGMENT:
+        return media
+
+    scale, cues_at = 1000000, None
+    for element, s, e in iter_elements(head, segment, len(head)):
+        if element == MKV_CLUSTER:
+            break
+        if element == MKV_SEEK_HEAD:
+            for seek, ss, se in iter_elements(head, s, e):
+                if seek != MKV_SEEK:
+                    continue
+                fields = {field: head[fs:fe] for field, fs, fe in iter_elements(head, ss, se)}
+                if int.from_bytes(fields.get(MKV_SEEK_ID, b""), "big") == MKV_CUES and MKV_SEEK_POSITION in fields:
+                    cues_at = segment + int.from_bytes(fields[MKV_SEEK_POSITION], "big")
+        elif element == MKV_INFO:
+            fields = {field: head[fs:fe] for field, fs, fe in iter_elements(head, s, e)}
+            if MKV_TIMECODE_SCALE in fields:
+                scale = int.from_bytes(fields[MKV_TIMECODE_SCALE], "big")
+            if (duration := fields.get(MKV_DURATION)) and len(duration) in (4, 8):
+                media["duration"] = struct.unpack(">f" if len(duration) == 4 else ">d", duration)[0] * scale / 1e9
+        elif element == MKV_CUES:
+            media["keyframes"] = parse_cues(head, s, e, segment, scale)
+            return media
+
+    if cues_at is None or cues_at >= size:
+        return media
+    header = await read(cues_at, min(cues_at + 11, size - 1))
+    try:
+        element, pos = read_vint(header, 0, keep_marker=True)
+        length, pos = read_vint(header, pos)
+    except (ValueError, IndexError):
+        return media
+    if element != MKV_CUES or length is None or length > Telegram.MOOV_MAX_MB * 1024 * 1024:
+        return media
+    cues = await read(cues_at + pos, min(cues_at + pos + length, size) - 1)
+    media["keyframes"] = parse_cues(cues, 0, len(cues), segment, scale)
+    return media
+
+
+async def build_index(streamer, file_id, index: int) -> dict:
+    unique_id = file_id.unique_id
+    path = os.path.join(INDEX_DIR, f"{unique_id}.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            media = json.load(f)
+        # mtime is the LRU clock prune_files evicts by.
+        os.utime(path)
+        return media
+
+    size = file_id.file_size
+    read = lambda start, end: read_range(streamer, file_id, index, start, end)
+    head = await read(0, min(HEAD_SIZE, size) - 1)
+    media = {"container": "unknown", "size": size, "duration": None, "keyframes": []}
+    if head[:4] == EBML_MAGIC:
+        media.update(await probe_matroska(read, size, head))
+    elif head[4:8] == b"ftyp":
+        media.update(await probe_mp4(read, unique_id, size, head))
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(media, f)
+    os.replace(f"{path}.tmp", path)
+    await asyncio.to_thread(prune_files, INDEX_DIR, Telegram.INDEX_CACHE_FILES)
+    logging.info(f"Built media index for {unique_id}: {media['container']}, {len(media['keyframes'])} keyframes")
+    return media
+
+
+async def get_index(streamer, file_id, index: int) -> dict:
+    """
+    Container layout and keyframe positions of a file, built on first use
+    and kept on disk by file_unique_id.
+    """
+    return await media_indexes.get(file_id.unique_id, lambda: build_index(streamer, file_id, index))
+
+
+def peek_index(unique_id: str) -> Optional[dict]:
+    return media_indexes.peek(unique_id)
+
+
+def warm_index(streamer, file_id, index: int) -> None:
+    """Build the index in the background, at most once at a time per file."""
+    unique_id = file_id.unique_id
+    if unique_id in warming:
+        return
+
+    async def warm():
+        try:
+            await get_index(streamer, file_id, index)
+        except Exception as e:
+            logging.warning(f"Could not index {unique_id}: {e}")
+        finally:
+            warming.discard(unique_id)
+
+    warming.add(unique_id)
+    asyncio.create_task(warm())
+
+
+async def cached_range(streamer, file_id, index: int, media: Optional[dict], start: int, end: int) -> Optional[memoryview]:
+    """
+    The bytes of [start, end] when they lie inside an MP4's moov, served
+    from memory. Players probe the moov before every cold start and seek.
+    """
+    if not media or not media.get("moov"):
+        return None
+    offset, length = media["moov"]
+    if start < offset or end >= offset + length or (moov := await get_moov(streamer, file_id, index, media)) is None:
+        return None
+    return memoryview(moov)[start - offset:end - offset + 1]
+
+
+async def get_moov(streamer, file_id, index: int, media: dict) -> Optional[bytes]:
+    """The complete moov box of an indexed MP4, or None if it is missing or too large to hold."""
+    if not media.get("moov"):
+        return None
+    offset, length = media["moov"]
+    if length > Telegram.MOOV_MAX_MB * 1024 * 1024:
+        return None
+    return await moov_cache.get(file_id.unique_id, lambda: read_range(streamer, file_id, index, offset, offset + length - 1))
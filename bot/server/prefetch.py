@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Awaitable, Callable, Tuple
+
+from bot.config import Telegram
+from bot.server.custom_dl import stream_stats
+from bot.server.media_index import get_index, get_moov
+
+# Files warmed recently are not warmed again for this long.
+RECENT_TTL = 10 * 60
+RECENT_SIZE = 1024
+
+
+class Prefetcher:
+    """
+    Speculative warm-up of a video when its watch page is rendered: the
+    first `size` bytes go through ByteStreamer into the chunk ring (and the
+    disk cache, if enabled) and the media index and moov are loaded, so the
+    player's first requests start warm.
+
+    Only `max_jobs` warm-ups run at once, one per client IP, each file at
+    most once per RECENT_TTL, and all of them share a byte budget refilled
+    every minute. Anything over those limits is skipped, never queued.
+    """
+
+    def __init__(self, size: int, max_jobs: int, budget_per_minute: int):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.budget = budget_per_minute
+        self.allowance = float(budget_per_minute)
+        self.updated = monotonic()
+        self.ips = set()
+        self.recent: "OrderedDict[str, float]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and self.max_jobs > 0
+
+    def spend(self, nbytes: int) -> bool:
+        now = monotonic()
+        self.allowance = min(self.budget, self.allowance + (now - self.updated) * self.budget / 60)
+        self.updated = now
+        if self.allowance < nbytes:
+            return False
+        self.allowance -= nbytes
+        return True
+
+    def seen(self, unique_id: str) -> bool:
+        now = monotonic()
+        while self.recent and next(iter(self.recent.values())) <= now:
+            self.recent.popitem(last=False)
+        return unique_id in self.recent
+
+    def mark(self, unique_id: str) -> None:
+        self.recent[unique_id] = monotonic() + RECENT_TTL
+        if len(self.recent) > RECENT_SIZE:
+            self.recent.popitem(last=False)
+
+    def schedule(self, ip: str, resolve: Callable[[], Awaitable[Tuple]]) -> bool:
+        """Start a warm-up in the background; `resolve` returns (streamer, file_id, client index)."""
+        if not self.enabled or len(self.ips) >= self.max_jobs or ip in self.ips:
+            stream_stats['prefetch_skipped'] += 1
+            return False
+        self.ips.add(ip)
+        asyncio.create_task(self.run(ip, resolve))
+        return True
+
+    async def run(self, ip: str, resolve) -> None:
+        try:
+            streamer, file_id, index = await resolve()
+            mime_type = file_id.mime_type or ''
+            if not mime_type.startswith(('video/', 'audio/')) or self.seen(file_id.unique_id):
+                return
+            # Whole 1 MiB parts, so the player's first request hits the same ring keys.
+            until_bytes = min(self.size, file_id.file_size) - 1
+            if until_bytes < 0 or not self.spend(until_bytes + 1):
+                stream_stats['prefetch_skipped'] += 1
+                return
+            # Marked only once it runs, so a file skipped for budget can be warmed later.
+            self.mark(file_id.unique_id)
+            if Telegram.MEDIA_INDEX:
+                media = await get_index(streamer, file_id, index)
+                await get_moov(streamer, file_id, index, media)
+            body = streamer.stream_range(file_id, index, 0, until_bytes)
+            try:
+                async for chunk in body:
+                    stream_stats['prefetch_bytes'] += len(chunk)
+            finally:
+                await body.aclose()
+            stream_stats['prefetched'] += 1
+        except Exception as e:
+            logging.debug(f"Watch page prefetch failed: {e}")
+        finally:
+            self.ips.discard(ip)
+
+
+prefetcher = Prefetcher(Telegram.WATCH_PREFETCH_MB * 1024 * 1024, Telegram.PREFETCH_JOBS, Telegram.PREFETCH_BUDGET_MB * 1024 * 1024)
@@ -27,7 +27,7 @@ hide_channel = """
                     </style>"""
 
 
-async def render_page(id, secure_hash, is_admin=False, html='', playlist='', database='', route='', redirect_url='', msg='', chat_id=''):
+async def render_page(id, secure_hash, is_admin=False, html='', playlist='', database='', route='', redirect_url='', msg='', chat_id='', sprite='', file_data=None):
     theme = await db.get_variable('theme')
     if theme is None or theme == '':
         theme = Telegram.THEME
@@ -45,15 +45,18 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
     elif route == 'playlist':
         async with aiopen(ospath.join(tpath, 'playlist.html'), 'r', encoding='utf-8') as f:
             html = (await f.read()).replace("<!-- Theme -->", theme.lower()).replace("<!-- Playlist -->", playlist).replace("<!-- Database -->", database).replace("<!-- Title -->", msg).replace("<!-- Parent_id -->", id)
+            html += sprite
             if not is_admin:
                 html += admin_block
     elif route == 'index':
         async with aiopen(ospath.join(tpath, 'index.html'), 'r', encoding='utf-8') as f:
             html = (await f.read()).replace("<!-- Print -->", html).replace("<!-- Theme -->", theme.lower()).replace("<!-- Title -->", msg).replace("<!-- Chat_id -->", chat_id)
+            html += sprite
             if not is_admin:
                 html += admin_block
     else:
-        file_data = await get_file_ids(StreamBot, chat_id=int(chat_id), message_id=int(id))
+        if file_data is None:
+            file_data = await get_file_ids(StreamBot, chat_id=int(chat_id), message_id=int(id))
         if file_data.unique_id[:6] != secure_hash:
             LOGGER.info('Link hash: %s - %s', secure_hash,
                         file_data.unique_id[:6])
@@ -74,7 +77,9 @@ async def render_page(id, secure_hash, is_admin=False, html='', playlist='', dat
             '<!-- BaseUrl -->': Telegram.BASE_URL,
             '<!-- ChatId -->': chat_id.replace("-100", ""),
             '<!-- MsgId -->': str(id),
-            '<!-- Hash -->': secure_hash
+            '<!-- Hash -->': secure_hash,
+            '<!-- HlsLink -->': f"{Telegram.BASE_URL}/hls/{chat_id.replace('-100', '')}/index.m3u8?id={id}&hash={secure_hash}" if Telegram.HLS_STREAMING else '',
+            '<!-- Faststart -->': str(Telegram.FASTSTART_STREAMING and Telegram.MEDIA_INDEX).lower()
         }
 
         if tag == 'video':
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from random import randint
+from typing import Dict, Iterable, List, Tuple
+
+from pyrogram import Client, raw
+from pyrogram.errors import AuthBytesInvalid
+from pyrogram.session import Session, Auth
+
+from bot.config import Telegram
+
+
+class MediaSessionPool:
+    """
+    Media sessions kept per (client, DC).
+
+    Sessions can be created ahead of time for the common DCs, up to
+    `size` sessions are opened per client and DC and handed out
+    round-robin, and a background task pings every session and rebuilds
+    the ones that stop answering.
+    """
+
+    def __init__(self, size: int, ping_interval: int):
+        self.size = max(1, size)
+        self.ping_interval = ping_interval
+        self.sessions: Dict[Tuple[Client, int], List[Session]] = {}
+        self.locks: Dict[Tuple[Client, int], asyncio.Lock] = {}
+        self.turns: Dict[Tuple[Client, int], int] = {}
+        self.rebuilds = 0
+        self.health_task = None
+
+    async def get(self, client: Client, dc_id: int) -> Session:
+        key = (client, dc_id)
+        sessions = self.sessions.get(key)
+        if not sessions:
+            await self.fill(client, dc_id, 1)
+            sessions = self.sessions[key]
+            if len(sessions) < self.size:
+                asyncio.create_task(self.fill(client, dc_id, self.size))
+        turn = self.turns.get(key, 0)
+        self.turns[key] = turn + 1
+        return sessions[turn % len(sessions)]
+
+    async def fill(self, client: Client, dc_id: int, count: int) -> None:
+        key = (client, dc_id)
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            sessions = self.sessions.setdefault(key, [])
+            while len(sessions) < count:
+                try:
+                    session = await self.create_session(client, dc_id)
+                except Exception:
+                    if not sessions:
+                        raise
+                    logging.warning(f"Could not open extra media session for DC {dc_id}", exc_info=True)
+                    return
+                sessions.append(session)
+                # Keep pyrogram's own download helpers on the pooled session.
+                client.media_sessions[dc_id] = sessions[0]
+
+    @staticmethod
+    async def create_session(client: Client, dc_id: int) -> Session:
+        if dc_id != await client.storage.dc_id():
+            media_session = Session(client,
+                                    dc_id,
+                                    await Auth(client, dc_id, await client.storage.test_mode()).create(),
+                                    await client.storage.test_mode(),
+                                    is_media=True)
+            await media_session.start()
+            for _ in range(6):
+                exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                try:
+                    await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
+                    break
+                except AuthBytesInvalid:
+                    logging.debug(
+                        'Invalid authorization bytes for DC %s!', dc_id)
+                    continue
+            else:
+                await media_session.stop()
+                raise AuthBytesInvalid
+        else:
+            media_session = Session(client,
+                                    dc_id,
+                                    await client.storage.auth_key(),
+                                    await client.storage.test_mode(),
+                                    is_media=True)
+            await media_session.start()
+        logging.debug(f"Created media session for DC {dc_id}")
+        return media_session
+
+    async def start(self, clients: Iterable[Client], dc_ids: Iterable[int] = ()) -> None:
+        """Pre-create sessions for `dc_ids` (or each client's home DC) and start health checks."""
+        dc_ids = list(dc_ids)
+
+        async def warm(client: Client):
+            for dc_id in dc_ids or [await client.storage.dc_id()]:
+                try:
+                    await self.fill(client, dc_id, self.size)
+                except Exception as e:
+                    logging.warning(f"Could not pre-warm media session for DC {dc_id}: {e}")
+
+        await asyncio.gather(*[warm(client) for client in clients])
+        logging.info(f"Pre-warmed {sum(map(len, self.sessions.values()))} media sessions")
+        if self.ping_interval > 0 and self.health_task is None:
+            self.health_task = asyncio.create_task(self.health_check())
+
+    async def health_check(self) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            for (client, dc_id), sessions in list(self.sessions.items()):
+                for session in list(sessions):
+                    try:
+                        await session.send(raw.functions.Ping(ping_id=randint(1, 2 ** 31)), timeout=10)
+                    except Exception as e:
+                        logging.warning(f"Media session for DC {dc_id} failed health check, rebuilding: {e}")
+                        asyncio.create_task(self.rebuild(client, dc_id, session))
+
+    async def rebuild(self, client: Client, dc_id: int, session: Session) -> None:
+        sessions = self.sessions.get((client, dc_id), [])
+        if session in sessions:
+            sessions.remove(session)
+        if client.media_sessions.get(dc_id) is session:
+            client.media_sessions.pop(dc_id, None)
+        try:
+            await session.stop()
+        except Exception:
+            pass
+        self.rebuilds += 1
+        try:
+            await self.fill(client, dc_id, self.size)
+        except Exception as e:
+            logging.warning(f"Could not rebuild media session for DC {dc_id}: {e}")
+
+
+session_pool = MediaSessionPool(Telegram.MEDIA_SESSIONS_PER_DC, Telegram.MEDIA_SESSION_PING)
@@ -0,0 +1,163 @@
+import asyncio
+from hashlib import sha256
+from heapq import heappop, heappush
+from ipaddress import ip_address
+from time import monotonic
+from typing import AsyncGenerator, Dict, List, Optional
+
+from bot.config import Telegram
+
+# Granularity at which shaped streams are metered.
+QUANTUM = 64 * 1024
+# Marks the server's own loopback reads; the same in every web worker.
+INTERNAL_TOKEN = sha256(f"{Telegram.BOT_TOKEN}:internal".encode()).hexdigest()[:32]
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` bytes/s with up to one second of burst."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = monotonic()
+
+    def refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, nbytes: int) -> None:
+        self.refill()
+        # Going into debt keeps concurrent takers in arrival order.
+        self.tokens -= nbytes
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    async def ready(self) -> None:
+        """Wait until the bucket is out of debt."""
+        self.refill()
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class ShapedStream:
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.finish = 0.0
+
+
+class FairQueue:
+    """
+    Self-clocked weighted fair queueing in front of a global token bucket.
+
+    Every quantum is tagged with a virtual finish time scaled by its
+    stream's weight, and the lowest tag is released first, so heavier
+    streams get a proportionally larger share of the global rate.
+    """
+
+    def __init__(self, rate: int):
+        self.bucket = TokenBucket(rate)
+        self.heap = []
+        self.vtime = 0.0
+        self.seq = 0
+        self.task = None
+
+    async def take(self, stream: ShapedStream, nbytes: int) -> None:
+        stream.finish = max(self.vtime, stream.finish) + nbytes / stream.weight
+        future = asyncio.get_running_loop().create_future()
+        heappush(self.heap, (stream.finish, self.seq, future, nbytes))
+        self.seq += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.dispatch())
+        await future
+
+    async def dispatch(self) -> None:
+        while self.heap:
+            # Pick the next quantum only once tokens are available, so streams
+            # that re-queue while we wait still compete on their tags.
+            await self.bucket.ready()
+            finish, _, future, nbytes = heappop(self.heap)
+            if future.done():
+                continue
+            self.vtime = finish
+            self.bucket.tokens -= nbytes
+            future.set_result(None)
+
+
+class TrafficShaper:
+    """
+    Egress shaping for media streams: a token bucket per client IP and per
+    logged-in user, plus a global cap shared through weighted fair
+    queueing where inline playback outweighs attachment downloads.
+    """
+
+    def __init__(self, ip_rate: int, user_rate: int, global_rate: int, inline_weight: int):
+        self.ip_rate = ip_rate
+        self.user_rate = user_rate
+        self.inline_weight = max(1, inline_weight)
+        self.fair_queue = FairQueue(global_rate) if global_rate > 0 else None
+        self.ip_buckets: Dict[str, list] = {}
+        self.user_buckets: Dict[str, list] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.ip_rate > 0 or self.user_rate > 0 or self.fair_queue)
+
+    @staticmethod
+    def exempt(ip: Optional[str], token: Optional[str]) -> bool:
+        """
+        Our own ffmpeg jobs reading for HLS: loopback peers carrying the
+        internal token. The segments they produce are shaped against the
+        real viewer instead.
+        """
+        if token != INTERNAL_TOKEN:
+            return False
+        try:
+            return bool(ip) and ip_address(ip).is_loopback
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _acquire(buckets: Dict[str, list], key: Optional[str], rate: int) -> Optional[TokenBucket]:
+        if rate <= 0 or not key:
+            return None
+        entry = buckets.setdefault(key, [TokenBucket(rate), 0])
+        entry[1] += 1
+        return entry[0]
+
+    @staticmethod
+    def _release(buckets: Dict[str, list], key: Optional[str]) -> None:
+        entry = buckets.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del buckets[key]
+
+    async def shape(self, body: AsyncGenerator, ip: Optional[str], user: Optional[str], interactive: bool) -> AsyncGenerator:
+        if not self.enabled:
+            async for chunk in body:
+                yield chunk
+            return
+        buckets: List[TokenBucket] = [bucket for bucket in (
+            self._acquire(self.ip_buckets, ip, self.ip_rate),
+            self._acquire(self.user_buckets, user, self.user_rate),
+        ) if bucket]
+        stream = ShapedStream(self.inline_weight if interactive else 1)
+        try:
+            async for chunk in body:
+                view = memoryview(chunk)
+                for start in range(0, len(view), QUANTUM):
+                    piece = view[start:start + QUANTUM]
+                    for bucket in buckets:
+                        await bucket.take(len(piece))
+                    if self.fair_queue:
+                        await self.fair_queue.take(stream, len(piece))
+                    yield piece
+        finally:
+            self._release(self.ip_buckets, ip if self.ip_rate > 0 else None)
+            self._release(self.user_buckets, user if self.user_rate > 0 else None)
+            await body.aclose()
+
+
+shaper = TrafficShaper(Telegram.RATE_LIMIT_IP_KB * 1024, Telegram.RATE_LIMIT_USER_KB * 1024,
+                       Telegram.RATE_LIMIT_GLOBAL_KB * 1024, Telegram.INLINE_STREAM_WEIGHT)
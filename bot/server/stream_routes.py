@@ -1,22 +1,32 @@
+import asyncio
 import json
 import logging
-import math
 import mimetypes
 import secrets
+from datetime import timezone
+from email.utils import format_datetime
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
 from bot.helper.chats import get_chats, post_playlist, posts_chat, posts_db_file
 from bot.helper.database import Database
 from bot.helper.search import search
-from bot.helper.thumbnail import get_image
-from bot.telegram import work_loads, multi_clients
+from bot.helper.sprites import sprite_css, sprite_sheets
+from bot.helper.thumbnail import get_image, get_variant, path as fallback_image, schedule_prefetch, thumbnail_fetcher
+from bot.telegram import multi_clients
+from bot.telegram.scheduler import scheduler
 from aiohttp_session import get_session
 from bot.config import Telegram
 from bot.helper.exceptions import FIleNotFound, InvalidHash
 from bot.helper.index import get_files, posts_file
-from bot.server.custom_dl import ByteStreamer
+from bot.server.custom_dl import ByteStreamer, stream_stats
+from bot.server.http_range import etag_matches, multipart_body, multipart_length, parse_range
+from bot.server.hls import PLAYLIST_CONTENT_TYPE, SEGMENT_CONTENT_TYPE, cut_segment, get_index, plan_version, render_playlist, segment_indexes, source_url
+from bot.server.faststart import get_layout as get_faststart_layout, open_range as faststart_range, patched_moovs
+from bot.server.media_index import cached_range, get_index as get_media_index, iter_bytes, media_indexes, moov_cache, peek_index, warm_index
+from bot.server.prefetch import prefetcher
 from bot.server.render_template import render_page
-from bot.helper.cache import rm_cache
+from bot.server.shaper import shaper
+from bot.helper.cache import rm_cache, rm_sprites
 
 from bot.telegram import StreamBot
 
@@ -88,6 +98,7 @@ async def delete_route(request):
     parent = data.get('parent')
     if not (success := db.delete(id)):
         return web.HTTPInternalServerError()
+    rm_sprites(f"db{parent}-")
     if parent == 'root':
         return web.HTTPFound('/')
     else:
@@ -126,6 +137,7 @@ async def editPost_route(request):
     success = await db.edit(id, fileName, thumbnail)
     if not success:
         return web.HTTPInternalServerError()
+    rm_sprites(f"db{parent}-")
     if parent == 'root':
         return web.HTTPFound('/')
     else:
@@ -170,6 +182,7 @@ async def send_route(request):
     json_data = json.dumps(formatted_entries)
     data = json.loads(json_data)
     await db.add_json(data)
+    rm_sprites(f"db{folder_id}-")
     if folder_id == 'root':
         return web.HTTPFound('/')
     else:
@@ -234,11 +247,13 @@ async def playlist_route(request):
             page = request.query.get('page', '1')
             playlists = await db.get_Dbfolder(parent_id, page=page)
             files = await db.get_dbFiles(parent_id, page=page)
+            schedule_prefetch([file.get('thumbnail') for file in files])
+            sheet = await sprite_sheets.get(f"db{parent_id}", page, [file.get('thumbnail') for file in files])
             text = await db.get_info(parent_id)
             dhtml = await post_playlist(playlists)
-            dphtml = await posts_db_file(files)
+            dphtml = await posts_db_file(files, sheet)
             is_admin = username == Telegram.ADMIN_USERNAME
-            return web.Response(text=await render_page(parent_id, None, route='playlist', playlist=dhtml, database=dphtml, msg=text, is_admin=is_admin), content_type='text/html')
+            return web.Response(text=await render_page(parent_id, None, route='playlist', playlist=dhtml, database=dphtml, msg=text, is_admin=is_admin, sprite=sprite_css(sheet)), content_type='text/html')
         except Exception as e:
             logging.critical(e.with_traceback(None))
             raise web.HTTPInternalServerError(text=str(e)) from e
@@ -279,9 +294,12 @@ async def channel_route(request):
         is_admin = username == Telegram.ADMIN_USERNAME
         try:
             posts = await get_files(chat_id, page=page)
-            phtml = await posts_file(posts, chat_id)
+            thumbs = [f"/api/thumb/{chat_id}?id={post['msg_id']}" for post in posts]
+            schedule_prefetch(thumbs)
+            sheet = await sprite_sheets.get(chat_id, page, thumbs)
+            phtml = await posts_file(posts, chat_id, sheet)
             chat = await StreamBot.get_chat(int(chat_id))
-            return web.Response(text=await render_page(None, None, route='index', html=phtml, msg=chat.title, chat_id=chat_id.replace("-100", ""), is_admin=is_admin), content_type='text/html')
+            return web.Response(text=await render_page(None, None, route='index', html=phtml, msg=chat.title, chat_id=chat_id.replace("-100", ""), is_admin=is_admin, sprite=sprite_css(sheet)), content_type='text/html')
         except Exception as e:
             logging.critical(e.with_traceback(None))
             raise web.HTTPInternalServerError(text=str(e)) from e
@@ -316,15 +334,51 @@ async def search_route(request):
 @routes.get('/api/thumb/{chat_id}', allow_head=True)
 async def get_thumbnail(request):
     chat_id = request.match_info['chat_id']
+    card = request.query.get('size') == 'card'
     if message_id := request.query.get('id'):
         img = await get_image(chat_id, message_id)
     else:
-        img = await get_image(chat_id, None)
-    response = web.FileResponse(img)
-    response.content_type = "image/jpeg"
+        img = await get_image(chat_id, None, small=card and Telegram.THUMB_RESIZE)
+    # FileResponse answers If-None-Match / If-Modified-Since on its own. The
+    # fallback may stand in for a thumbnail that is still loading, so it is
+    # only cached briefly.
+    max_age = 60 if img == fallback_image else 86400
+    headers = {"Cache-Control": f"public, max-age={max_age}"}
+    content_type = "image/jpeg"
+    if card:
+        # Retina variant when the browser sends the DPR client hint.
+        try:
+            dpr = float(request.headers.get('Sec-CH-DPR') or request.headers.get('DPR') or 1)
+        except ValueError:
+            dpr = 1
+        img, content_type = await get_variant(img, message_id is None, 2 if dpr >= 1.5 else 1, request.headers.get('Accept', ''))
+        headers['Vary'] = 'Accept, Sec-CH-DPR, DPR'
+    response = web.FileResponse(img, headers=headers)
+    response.content_type = content_type
     return response
 
 
+@routes.get('/api/sprite/{name}', allow_head=True)
+async def get_sprite(request):
+    if not (sheet := await sprite_sheets.file(request.match_info['name'], request.headers.get('Accept', ''))):
+        raise web.HTTPNotFound()
+    file, content_type = sheet
+    response = web.FileResponse(file, headers={"Cache-Control": "public, max-age=86400", "Vary": "Accept"})
+    response.content_type = content_type
+    return response
+
+
+@routes.get('/api/clients')
+async def clients_route(request):
+    session = await get_session(request)
+    if (username := session.get('user')) != Telegram.ADMIN_USERNAME:
+        return web.json_response({'msg': 'Who the hell you are'})
+    caches = {f"file_ids_{client.name}": streamer.cached_file_ids.stats() for client, streamer in class_cache.items()}
+    caches.update(media_indexes=media_indexes.stats(), moovs=moov_cache.stats(), faststart=patched_moovs.stats(), hls=segment_indexes.stats())
+    return web.json_response({'worker': Telegram.WORKER_ID, 'clients': scheduler.snapshot(), 'streams': dict(stream_stats),
+                              'caches': caches, 'thumbnails': dict(thumbnail_fetcher.stats)})
+
+
 @routes.get('/watch/{chat_id}', allow_head=True)
 async def stream_handler_watch(request: web.Request):
     session = await get_session(request)
@@ -334,7 +388,13 @@ async def stream_handler_watch(request: web.Request):
             chat_id = f"-100{chat_id}"
             message_id = request.query.get('id')
             secure_hash = request.query.get('hash')
-            return web.Response(text=await render_page(message_id, secure_hash, chat_id=chat_id), content_type='text/html')
+            # Resolved once through client 0's cache; the page and the warm-up share it.
+            tg_connect = get_streamer(0)
+            file_data = await tg_connect.get_file_properties(chat_id=int(chat_id), message_id=int(message_id))
+            html = await render_page(message_id, secure_hash, chat_id=chat_id, file_data=file_data)
+            if request.method != 'HEAD':
+                prefetcher.schedule(request.remote, lambda: resolve_watch(tg_connect, file_data))
+            return web.Response(text=html, content_type='text/html')
         except InvalidHash as e:
             raise web.HTTPForbidden(text=e.message) from e
         except FIleNotFound as e:
@@ -350,6 +410,103 @@ async def stream_handler_watch(request: web.Request):
         return web.HTTPFound('/login')
 
 
+async def resolve_watch(tg_connect: ByteStreamer, file_data):
+    return tg_connect, file_data, 0
+
+
+async def resolve_hls(request: web.Request):
+    chat_id = f"-100{request.match_info['chat_id']}"
+    message_id = int(request.query.get('id'))
+    secure_hash = request.query.get('hash')
+    index = scheduler.pick()
+    file_id = await get_streamer(index).get_file_properties(chat_id=int(chat_id), message_id=message_id)
+    if file_id.unique_id[:6] != secure_hash:
+        raise InvalidHash
+    url = source_url(chat_id, message_id, secure_hash)
+    media = None
+    if Telegram.MEDIA_INDEX:
+        try:
+            media = await get_media_index(get_streamer(index), file_id, index)
+        except Exception as e:
+            logging.warning(f"No media index for message {message_id}, probing with ffprobe: {e}")
+    return file_id, url, await get_index(file_id.unique_id, url, media)
+
+
+@routes.get('/hls/{chat_id}/index.m3u8', allow_head=True)
+async def hls_playlist_route(request: web.Request):
+    try:
+        file_id, url, index = await resolve_hls(request)
+        # A plan made without keyframes is rebuilt once they are known, so
+        # only a final plan's playlist may be cached.
+        cache_control = "public, max-age=86400" if index.get("keyframes") else "no-cache"
+        return web.Response(text=render_playlist(index, request.query_string), content_type=PLAYLIST_CONTENT_TYPE,
+                            headers={"Cache-Control": cache_control})
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message) from e
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message) from e
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
+
+@routes.get(r'/hls/{chat_id}/{plan:[0-9a-f]+}/{segment:\d+}.ts', allow_head=True)
+@routes.get(r'/hls/{chat_id}/{segment:\d+}.ts', allow_head=True)
+async def hls_segment_route(request: web.Request):
+    try:
+        file_id, url, index = await resolve_hls(request)
+        number = int(request.match_info['segment'])
+        plan = request.match_info.get('plan')
+        if number >= len(index['segments']) or plan not in (None, plan_version(index)):
+            raise web.HTTPNotFound()
+        start, duration = index['segments'][number]
+        etag = f'"{file_id.unique_id}-{start:.3f}-{duration:.3f}"'
+        # Unversioned URLs come from playlists rendered before plans were
+        # versioned and may point at a different plan, so they revalidate.
+        cache_control = "public, max-age=31536000, immutable" if plan else "no-cache"
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return web.Response(status=304, headers=headers)
+        if request.method == 'HEAD':
+            return web.Response(headers={"ETag": etag, "Cache-Control": "no-cache", "Content-Type": SEGMENT_CONTENT_TYPE})
+        try:
+            data = await cut_segment(url, start, duration)
+        except (OSError, RuntimeError) as e:
+            logging.error(f"HLS segment {number} of message {file_id.message_id} failed: {e}")
+            return web.Response(status=502, text="Segment unavailable", headers={"Cache-Control": "no-store"})
+        response = web.StreamResponse(headers={**headers, "Content-Type": SEGMENT_CONTENT_TYPE, "Content-Length": str(len(data))})
+        return await send_body(request, response, iter_bytes(data), file_id.message_id, True)
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message) from e
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message) from e
+    except (web.HTTPException, ConnectionResetError):
+        raise
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
+
+@routes.get('/faststart/{chat_id}/{encoded_name}', allow_head=True)
+async def faststart_handler(request: web.Request):
+    try:
+        chat_id = f"-100{request.match_info['chat_id']}"
+        message_id = request.query.get('id')
+        secure_hash = request.query.get('hash')
+        return await faststart_streamer(request, int(chat_id), int(message_id), secure_hash)
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message) from e
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message) from e
+    except web.HTTPException:
+        raise
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
+
 @routes.get('/{chat_id}/{encoded_name}', allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -372,24 +529,78 @@ async def stream_handler(request: web.Request):
 
 
 class_cache = {}
+DISCONNECT_POLL = 0.25
+
+
+def peer_gone(request: web.Request) -> bool:
+    transport = request.transport
+    return transport is None or transport.is_closing()
+
+
+def get_cache_headers(file_id, etag: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if last_modified := getattr(file_id, 'date', None):
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(request: web.Request, file_id, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    last_modified = getattr(file_id, 'date', None)
+    return bool(last_modified and request.if_modified_since
+                and last_modified.astimezone(timezone.utc).replace(microsecond=0) <= request.if_modified_since)
+
+
+def range_matches(request: web.Request, cache_headers: dict) -> bool:
+    """Whether the If-Range validator, if any, still names the current file."""
+    if_range = request.headers.get("If-Range")
+    return not if_range or etag_matches(if_range, cache_headers["ETag"], weak=False) or if_range == cache_headers.get("Last-Modified")
+
+
+def expected_length(range_header):
+    """Length of a closed `bytes=a-b` range, or None when it depends on the file size."""
+    try:
+        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
+        return int(until_bytes) - int(from_bytes) + 1
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_streamer(index: int) -> ByteStreamer:
+    client = multi_clients[index]
+    if client in class_cache:
+        logging.debug(f"Using cached ByteStreamer object for client {index}")
+        return class_cache[client]
+    logging.debug(f"Creating new ByteStreamer object for client {index}")
+    tg_connect = class_cache[client] = ByteStreamer(client)
+    return tg_connect
+
+
+async def get_stripes(index: int, chat_id: int, message_id: int, file_id):
+    """Pick the least loaded clients to stripe one range across, primary client first."""
+    others = scheduler.ranked(exclude=(index,))[:Telegram.STRIPE_CLIENTS - 1]
+
+    async def resolve(i):
+        try:
+            return i, get_streamer(i), await get_streamer(i).get_file_properties(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logging.warning(f"Client {i} cannot access message {message_id}, not striping on it: {e}")
+
+    resolved = await asyncio.gather(*[resolve(i) for i in others])
+    return [(index, get_streamer(index), file_id)] + [stripe for stripe in resolved if stripe]
 
 
 async def media_streamer(request: web.Request, chat_id: int, id: int, secure_hash: str):
     range_header = request.headers.get("Range", 0)
 
-    index = min(work_loads, key=work_loads.get)
-    faster_client = multi_clients[index]
+    index = scheduler.pick(expected_length(range_header))
 
     if Telegram.MULTI_CLIENT:
         logging.info(f"Client {index} is now serving {request.remote}")
 
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
-        logging.debug(f"Using cached ByteStreamer object for client {index}")
-    else:
-        logging.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
+    tg_connect = get_streamer(index)
     logging.debug("before calling get_file_properties")
     file_id = await tg_connect.get_file_properties(chat_id=chat_id, message_id=id)
     logging.debug("after calling get_file_properties")
@@ -399,36 +610,22 @@ async def media_streamer(request: web.Request, chat_id: int, id: int, secure_has
         raise InvalidHash
 
     file_size = file_id.file_size
-
-    if range_header:
-        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
-        from_bytes = int(from_bytes)
-        until_bytes = int(until_bytes) if until_bytes else file_size - 1
-    else:
-        from_bytes = request.http_range.start or 0
-        until_bytes = (request.http_range.stop or file_size) - 1
-
-    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+    etag = f'"{file_id.unique_id}"'
+    cache_headers = get_cache_headers(file_id, etag)
+    if not_modified(request, file_id, etag):
+        return web.Response(status=304, headers=cache_headers)
+    if not range_matches(request, cache_headers):
+        # The client's partial copy is stale, send the whole file instead.
+        range_header = None
+
+    ranges = parse_range(range_header, file_size)
+    if ranges == []:
         return web.Response(
             status=416,
             body="416: Range not satisfiable",
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
-    until_bytes = min(until_bytes, file_size - 1)
-
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
-
-    req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - \
-        math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
-
     mime_type = file_id.mime_type
     file_name = file_id.file_name
     disposition = "inline" if mime_type and (mime_type == 'application/pdf' or mime_type.startswith('video/')) else "attachment"
@@ -441,19 +638,146 @@ async def media_streamer(request: web.Request, chat_id: int, id: int, secure_has
                 file_name = f"{secrets.token_hex(2)}.unknown"
     else:
         if file_name:
-            mime_type = mimetypes.guess_type(file_id.file_name)
+            mime_type = mimetypes.guess_type(file_id.file_name)[0] or "application/octet-stream"
         else:
             mime_type = "application/octet-stream"
             file_name = f"{secrets.token_hex(2)}.unknown"
 
-    return web.Response(
-        status=206 if range_header else 200,
-        body=body,
-        headers={
-            "Content-Type": f"{mime_type}",
-            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'{disposition}; filename="{file_name}"',
-            "Accept-Ranges": "bytes",
-        },
-    )
+    media = None
+    if Telegram.MEDIA_INDEX and mime_type.startswith('video/'):
+        media = peek_index(file_id.unique_id)
+        if media is None and request.method != 'HEAD':
+            warm_index(tg_connect, file_id, index)
+
+    headers = {
+        **cache_headers,
+        "Content-Disposition": f'{disposition}; filename="{file_name}"',
+        "Accept-Ranges": "bytes",
+    }
+    if ranges is not None and len(ranges) > 1:
+        boundary = secrets.token_hex(16)
+        body = multipart_body(boundary, mime_type, ranges, file_size,
+                              lambda start, end: tg_connect.stream_range(file_id, index, start, end))
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(multipart_length(boundary, mime_type, ranges, file_size))
+    else:
+        from_bytes, until_bytes = ranges[0] if ranges else (0, file_size - 1)
+        req_length = until_bytes - from_bytes + 1
+        if (cached := await cached_range(tg_connect, file_id, index, media, from_bytes, until_bytes)) is not None:
+            stream_stats['moov_hits'] += 1
+            body = iter_bytes(cached)
+        else:
+            stripes = None
+            if Telegram.STRIPE_DOWNLOADS and len(multi_clients) > 1 and req_length >= Telegram.STRIPE_MIN_SIZE_MB * 1024 * 1024:
+                stripes = await get_stripes(index, chat_id, id, file_id)
+            body = tg_connect.stream_range(file_id, index, from_bytes, until_bytes, stripes)
+        headers["Content-Type"] = mime_type
+        headers["Content-Length"] = str(req_length)
+        if ranges:
+            headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+
+    response = web.StreamResponse(status=206 if ranges else 200, headers=headers)
+    return await send_body(request, response, body, id, disposition == "inline")
+
+
+async def send_body(request: web.Request, response: web.StreamResponse, body, message_id: int, interactive: bool):
+    """Stream `body` to the client, stopping the Telegram fetches as soon as it disconnects."""
+    if shaper.enabled and not shaper.exempt(request.remote, request.query.get('internal')):
+        session = await get_session(request)
+        body = shaper.shape(body, request.remote, session.get('user'), interactive)
+
+    await response.prepare(request)
+    if request.method == 'HEAD':
+        await body.aclose()
+        return response
+    body_iter = body.__aiter__()
+    next_chunk = None
+    try:
+        while True:
+            # Wait for the next part while watching the socket, so a viewer
+            # that seeks or closes the tab cancels the in-flight GetFile calls
+            # right away instead of after another part has been fetched.
+            next_chunk = asyncio.ensure_future(body_iter.__anext__())
+            while not next_chunk.done():
+                await asyncio.wait({next_chunk}, timeout=DISCONNECT_POLL)
+                if peer_gone(request):
+                    next_chunk.cancel()
+                    await asyncio.wait({next_chunk})
+                    raise ConnectionResetError
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            if peer_gone(request):
+                stream_stats['undelivered_bytes'] += len(chunk)
+                raise ConnectionResetError
+            # write() drains the transport once its buffer passes the
+            # high-water mark, so a slow client holds back further reads.
+            await response.write(chunk)
+        await response.write_eof()
+    except (ConnectionResetError, asyncio.CancelledError) as e:
+        stream_stats['disconnects'] += 1
+        logging.debug(f"Client {request.remote} went away while streaming message {message_id}")
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    except Exception:
+        # The headers (and Content-Length) are already out, so dropping the
+        # connection is the only way to tell the client the body is short.
+        stream_stats['failed_streams'] += 1
+        logging.warning(f"Streaming message {message_id} to {request.remote} failed", exc_info=True)
+        response.force_close()
+    finally:
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.wait({next_chunk})
+        await body.aclose()
+    return response
+
+
+async def faststart_streamer(request: web.Request, chat_id: int, id: int, secure_hash: str):
+    """
+    Serve an MP4 whose moov trails the mdat as if it had been remuxed with
+    faststart: the patched moov comes from memory and the media data is
+    streamed from Telegram unchanged. Other files redirect to the plain link.
+    """
+    index = scheduler.pick()
+    tg_connect = get_streamer(index)
+    file_id = await tg_connect.get_file_properties(chat_id=chat_id, message_id=id)
+    if file_id.unique_id[:6] != secure_hash:
+        raise InvalidHash
+    layout = await get_faststart_layout(tg_connect, file_id, index) if Telegram.MEDIA_INDEX else None
+    if layout is None:
+        raise web.HTTPFound(f"/{request.match_info['chat_id']}/{request.match_info['encoded_name']}?{request.query_string}")
+
+    file_size = file_id.file_size
+    etag = f'"{file_id.unique_id}-faststart"'
+    cache_headers = get_cache_headers(file_id, etag)
+    if not_modified(request, file_id, etag):
+        return web.Response(status=304, headers=cache_headers)
+    range_header = request.headers.get("Range") if range_matches(request, cache_headers) else None
+    ranges = parse_range(range_header, file_size)
+    if ranges == []:
+        return web.Response(status=416, body="416: Range not satisfiable", headers={"Content-Range": f"bytes */{file_size}"})
+
+    mime_type = file_id.mime_type or "video/mp4"
+    headers = {
+        **cache_headers,
+        "Content-Disposition": f'inline; filename="{file_id.file_name or f"{secrets.token_hex(2)}.mp4"}"',
+        "Accept-Ranges": "bytes",
+    }
+    open_range = lambda start, end: faststart_range(tg_connect, file_id, index, layout, start, end)
+    if ranges is not None and len(ranges) > 1:
+        boundary = secrets.token_hex(16)
+        body = multipart_body(boundary, mime_type, ranges, file_size, open_range)
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(multipart_length(boundary, mime_type, ranges, file_size))
+    else:
+        from_bytes, until_bytes = ranges[0] if ranges else (0, file_size - 1)
+        body = open_range(from_bytes, until_bytes)
+        headers["Content-Type"] = mime_type
+        headers["Content-Length"] = str(until_bytes - from_bytes + 1)
+        if ranges:
+            headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+
+    response = web.StreamResponse(status=206 if ranges else 200, headers=headers)
+    return await send_body(request, response, body, id, True)
@@ -3,17 +3,21 @@ from bot.config import Telegram
 
 
 plugins = {"root": "bot/telegram/plugins"}
+# Extra web workers keep their own session file, so restarts don't log the
+# bot in again, and leave updates to worker 0.
+worker_options = {} if Telegram.WORKER_ID == 0 else {"no_updates": True}
 
 StreamBot = Client(
-    name='bot',
+    name='bot' if Telegram.WORKER_ID == 0 else f'bot-worker{Telegram.WORKER_ID}',
     api_id=Telegram.API_ID,
     api_hash=Telegram.API_HASH,
     bot_token=Telegram.BOT_TOKEN,
     workdir="bot",
-    plugins=plugins,
+    plugins=plugins if Telegram.WORKER_ID == 0 else None,
     sleep_threshold=Telegram.SLEEP_THRESHOLD,
     workers=Telegram.WORKERS,
-    max_concurrent_transmissions=1000
+    max_concurrent_transmissions=1000,
+    **worker_options
 )
 UserBot = Client(
     name='user',
@@ -26,4 +30,3 @@ UserBot = Client(
 )
 
 multi_clients = {}
-work_loads = {}
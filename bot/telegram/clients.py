@@ -4,11 +4,13 @@ from pyrogram import Client
 from bot import LOGGER
 from bot.config import Telegram
 from bot.helper.parser import TokenParser
-from bot.telegram import multi_clients, work_loads, StreamBot
+from bot.telegram import multi_clients, StreamBot
+from bot.telegram.scheduler import scheduler
 
 
 async def initialize_clients():
-    multi_clients[0], work_loads[0] = StreamBot, 0
+    multi_clients[0] = StreamBot
+    scheduler.register(0)
     all_tokens = TokenParser().parse_from_env()
     if not all_tokens:
         LOGGER.info("No additional Bot Clients found, Using default client")
@@ -19,16 +21,18 @@ async def initialize_clients():
             LOGGER.info(f"Starting - Bot Client {client_id}")
             if client_id == len(all_tokens):
                 await asleep(2)
+            # A session file per worker, so restarts reuse the authorization
+            # instead of importing every token again.
             client = await Client(
-                name=str(client_id),
+                name=str(client_id) if Telegram.WORKER_ID == 0 else f"{client_id}-worker{Telegram.WORKER_ID}",
                 api_id=Telegram.API_ID,
                 api_hash=Telegram.API_HASH,
                 bot_token=token,
+                workdir="bot",
                 sleep_threshold=Telegram.SLEEP_THRESHOLD,
-                no_updates=True,
-                in_memory=True
+                no_updates=True
             ).start()
-            work_loads[client_id] = 0
+            scheduler.register(client_id)
             return client_id, client
         except Exception:
             LOGGER.error(
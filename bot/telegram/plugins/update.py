@@ -8,6 +8,7 @@ from pyrogram.types import Message
 from pyrogram.enums.parse_mode import ParseMode
 from bot.config import Telegram
 from bot.telegram import StreamBot
+from bot.helper.workers import supervisor
 
 LOGGER = logging.getLogger(__name__)
 
@@ -139,7 +140,8 @@ async def update_bot(bot: Client, message: Message):
     else:
         python = sys.executable
 
-    # Stop the bot client gracefully before exec
+    # Stop the web workers and the bot client gracefully before exec
+    await supervisor.stop()
     try:
         await bot.stop()
     except Exception:
@@ -0,0 +1,130 @@
+from time import monotonic, time
+from typing import Dict, List, Optional
+
+# Throughput assumed for a client that has not served anything yet.
+DEFAULT_THROUGHPUT = 4 * 1024 * 1024
+EWMA_WEIGHT = 0.2
+
+
+class ClientState:
+    def __init__(self):
+        self.streams = 0
+        self.inflight_bytes = 0
+        self.throughput = DEFAULT_THROUGHPUT
+        self.error_rate = 0.0
+        self.errors = 0
+        self.requests = 0
+        self.served_bytes = 0
+        self.flood_until = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "streams": self.streams,
+            "inflight_bytes": self.inflight_bytes,
+            "throughput": round(self.throughput),
+            "error_rate": round(self.error_rate, 4),
+            "errors": self.errors,
+            "requests": self.requests,
+            "served_bytes": self.served_bytes,
+            "flood_wait": max(0, round(self.flood_until - monotonic())),
+        }
+
+
+class ClientScheduler:
+    """
+    Route streams to bot clients by expected completion time.
+
+    Each client tracks the bytes it still has to fetch for open streams,
+    an EWMA of its recent GetFile throughput, an EWMA error rate and any
+    FloodWait cooldown. A new stream goes to the client that would finish
+    its current backlog plus the new range soonest.
+    """
+
+    def __init__(self):
+        self.clients: Dict[int, ClientState] = {}
+        # Load of the same bot accounts in other web workers: index -> (inflight bytes, monotonic flood end).
+        self.remote: Dict[int, tuple] = {}
+
+    def register(self, index: int) -> None:
+        self.clients.setdefault(index, ClientState())
+
+    def expected_time(self, index: int, nbytes: int = 0) -> float:
+        state = self.clients[index]
+        inflight = state.inflight_bytes + self.remote.get(index, (0, 0.0))[0]
+        return (inflight + nbytes) / state.throughput * (1 + 4 * state.error_rate)
+
+    def flood_until(self, index: int) -> float:
+        return max(self.clients[index].flood_until, self.remote.get(index, (0, 0.0))[1])
+
+    def pick(self, nbytes: Optional[int] = None, exclude=()) -> int:
+        now = monotonic()
+        candidates = [i for i in self.clients if i not in exclude] or list(self.clients)
+        ready = [i for i in candidates if self.flood_until(i) <= now]
+        if not ready:
+            return min(candidates, key=self.flood_until)
+        return min(ready, key=lambda i: self.expected_time(i, nbytes or 0))
+
+    def ranked(self, exclude=()) -> list:
+        """Clients not in FloodWait, fastest expected completion first."""
+        now = monotonic()
+        ready = [i for i in self.clients if i not in exclude and self.flood_until(i) <= now]
+        return sorted(ready, key=self.expected_time)
+
+    def start(self, index: int, nbytes: int) -> None:
+        state = self.clients[index]
+        state.streams += 1
+        state.inflight_bytes += nbytes
+
+    def charge(self, index: int, nbytes: int) -> None:
+        """Change the backlog of a stream the client already serves."""
+        state = self.clients[index]
+        state.inflight_bytes = max(0, state.inflight_bytes + nbytes)
+
+    def release(self, index: int, nbytes: int) -> None:
+        state = self.clients[index]
+        state.inflight_bytes = max(0, state.inflight_bytes - nbytes)
+        state.served_bytes += nbytes
+
+    def finish(self, index: int, remaining: int) -> None:
+        state = self.clients[index]
+        state.streams -= 1
+        state.inflight_bytes = max(0, state.inflight_bytes - remaining)
+
+    def record(self, index: int, nbytes: int, elapsed: float) -> None:
+        state = self.clients[index]
+        state.requests += 1
+        state.error_rate *= 1 - EWMA_WEIGHT
+        if nbytes and elapsed > 0:
+            state.throughput += EWMA_WEIGHT * (nbytes / elapsed - state.throughput)
+
+    def error(self, index: int) -> None:
+        state = self.clients[index]
+        state.requests += 1
+        state.errors += 1
+        state.error_rate += EWMA_WEIGHT * (1 - state.error_rate)
+
+    def flood(self, index: int, seconds: float) -> None:
+        state = self.clients[index]
+        state.flood_until = max(state.flood_until, monotonic() + seconds)
+
+    def export(self) -> dict:
+        """This process's load per client, with FloodWait ends as wall-clock times for other workers."""
+        offset = time() - monotonic()
+        return {str(i): [state.inflight_bytes, state.flood_until + offset if state.flood_until else 0]
+                for i, state in self.clients.items()}
+
+    def merge(self, workers: List[dict]) -> None:
+        """Replace the remote load with the sum of other workers' exports."""
+        offset = time() - monotonic()
+        remote = {}
+        for load in workers:
+            for i, (inflight, flood_until) in load.items():
+                total, until = remote.get(int(i), (0, 0.0))
+                remote[int(i)] = (total + inflight, max(until, flood_until - offset))
+        self.remote = remote
+
+    def snapshot(self) -> dict:
+        return {str(i): state.as_dict() for i, state in sorted(self.clients.items())}
+
+
+scheduler = ClientScheduler()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# bot.config reads these at import time; nothing connects to them in tests.
+os.environ.setdefault('DATABASE_URL', 'mongodb://localhost')
+os.environ.setdefault('CHUNK_CACHE_SIZE_MB', '0')
+# Importing bot writes log.txt and .server_secret to the working directory.
+os.chdir(tempfile.mkdtemp(prefix='surf-tests-'))
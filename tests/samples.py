@@ -0,0 +1,155 @@
+"""Small synthetic MP4 and Matroska files for the parser tests."""
+import struct
+
+# 300 video samples at 30 fps (timescale 3000, 100 ticks each) with a
+# keyframe every 60 samples, i.e. at 0, 2, 4, 6 and 8 seconds.
+SAMPLES = 300
+KEYFRAME_EVERY = 60
+TIMESCALE = 3000
+SAMPLE_DELTA = 100
+# stsc runs as (first chunk, samples per chunk): 10 chunks of 3, then chunks of 2.
+CHUNK_RUNS = [(1, 3), (11, 2)]
+
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind: bytes, payload: bytes, version: int = 0) -> bytes:
+    return box(kind, bytes([version, 0, 0, 0]) + payload)
+
+
+def sample_size(sample: int) -> int:
+    return 200 + sample
+
+
+def sample_data(sample: int) -> bytes:
+    """Sample payloads are filled with a byte derived from their number, so offsets can be checked."""
+    return bytes([sample % 251]) * sample_size(sample)
+
+
+def chunk_layout():
+    """Samples (1-based) of each chunk, following CHUNK_RUNS."""
+    chunks, sample, chunk = [], 1, 1
+    while sample <= SAMPLES:
+        per_chunk = next(per for first, per in reversed(CHUNK_RUNS) if chunk >= first)
+        chunks.append(list(range(sample, min(sample + per_chunk, SAMPLES + 1))))
+        sample += per_chunk
+        chunk += 1
+    return chunks
+
+
+def mdat_payload() -> bytes:
+    return b"".join(sample_data(sample) for sample in range(1, SAMPLES + 1))
+
+
+def sample_positions(mdat_start: int) -> dict:
+    """File offset of every sample when the mdat payload starts at `mdat_start`."""
+    positions, pos = {}, mdat_start
+    for sample in range(1, SAMPLES + 1):
+        positions[sample] = pos
+        pos += sample_size(sample)
+    return positions
+
+
+def make_moov(mdat_start: int, co64: bool = False, base: int = 0) -> bytes:
+    positions = sample_positions(mdat_start)
+    offsets = [positions[chunk[0]] + base for chunk in chunk_layout()]
+    if co64:
+        offset_box = full_box(b"co64", struct.pack(">I", len(offsets)) + b"".join(struct.pack(">Q", o) for o in offsets))
+    else:
+        offset_box = full_box(b"stco", struct.pack(">I", len(offsets)) + b"".join(struct.pack(">I", o) for o in offsets))
+    keyframes = range(1, SAMPLES + 1, KEYFRAME_EVERY)
+    stbl = box(b"stbl", b"".join([
+        full_box(b"stts", struct.pack(">III", 1, SAMPLES, SAMPLE_DELTA)),
+        # Every sample is presented 200 ticks late; the edit list takes it back out.
+        full_box(b"ctts", struct.pack(">III", 1, SAMPLES, 200)),
+        full_box(b"stss", struct.pack(">I", len(keyframes)) + b"".join(struct.pack(">I", k) for k in keyframes)),
+        full_box(b"stsc", struct.pack(">I", len(CHUNK_RUNS)) + b"".join(struct.pack(">III", first, per, 1) for first, per in CHUNK_RUNS)),
+        full_box(b"stsz", struct.pack(">II", 0, SAMPLES) + b"".join(struct.pack(">I", sample_size(s)) for s in range(1, SAMPLES + 1))),
+        offset_box,
+    ]))
+    mdia = box(b"mdia", full_box(b"mdhd", struct.pack(">IIII", 0, 0, TIMESCALE, SAMPLES * SAMPLE_DELTA) + b"\0" * 4)
+               + full_box(b"hdlr", b"\0" * 4 + b"vide" + b"\0" * 12)
+               + box(b"minf", stbl))
+    edts = box(b"edts", full_box(b"elst", struct.pack(">I", 1) + struct.pack(">IiI", SAMPLES * SAMPLE_DELTA, 200, 0x10000)))
+    video = box(b"trak", edts + mdia)
+    # An audio track first, which the keyframe index must skip.
+    audio = box(b"trak", box(b"mdia", full_box(b"hdlr", b"\0" * 4 + b"soun" + b"\0" * 12)))
+    return box(b"moov", full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 10000) + b"\0" * 80) + audio + video)
+
+
+FTYP = box(b"ftyp", b"isom\0\0\0\0isom")
+
+
+def make_mp4(faststart: bool, co64: bool = False):
+    """(file bytes, offset of the mdat payload)."""
+    payload = mdat_payload()
+    if faststart:
+        moov_size = len(make_moov(0, co64))
+        mdat_start = len(FTYP) + moov_size + 8
+        return FTYP + make_moov(mdat_start, co64) + box(b"mdat", payload), mdat_start
+    mdat_start = len(FTYP) + 8
+    return FTYP + box(b"mdat", payload) + make_moov(mdat_start, co64), mdat_start
+
+
+def expected_keyframes(mdat_start: int):
+    positions = sample_positions(mdat_start)
+    return [[(k - 1) * SAMPLE_DELTA / TIMESCALE, positions[k]] for k in range(1, SAMPLES + 1, KEYFRAME_EVERY)]
+
+
+def ebml_id(element: int) -> bytes:
+    return element.to_bytes((element.bit_length() + 7) // 8, "big")
+
+
+def ebml_size(size: int) -> bytes:
+    length = 1
+    while size >= (1 << (7 * length)) - 1:
+        length += 1
+    return (size | 1 << (7 * length)).to_bytes(length, "big")
+
+
+def element(element_id: int, payload: bytes) -> bytes:
+    return ebml_id(element_id) + ebml_size(len(payload)) + payload
+
+
+def uint(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def make_mkv(cluster_size: int, cues_first: bool, cluster_count: int = 4):
+    """
+    (file bytes, expected keyframes) for a Matroska file with one cluster
+    every 2 seconds. Cues come either before the clusters or after them,
+    found through the SeekHead.
+    """
+    clusters = [element(0x1F43B675, element(0xE7, uint(i * 2000)) + bytes([i]) * cluster_size) for i in range(cluster_count)]
+    info = element(0x1549A966, element(0x2AD7B1, uint(1000000)) + element(0x4489, struct.pack(">d", cluster_count * 2000.0)))
+
+    def cues(cluster_start: int) -> bytes:
+        points, pos = [], cluster_start
+        for i, cluster in enumerate(clusters):
+            positions = element(0xF7, uint(1)) + element(0xF1, pos.to_bytes(8, "big"))
+            points.append(element(0xBB, element(0xB3, uint(i * 2000)) + element(0xB7, positions)))
+            pos += len(cluster)
+        return element(0x1C53BB6B, b"".join(points))
+
+    def seek_head(cues_at: int) -> bytes:
+        seek = element(0x53AB, ebml_id(0x1C53BB6B)) + element(0x53AC, cues_at.to_bytes(8, "big"))
+        return element(0x114D9B74, element(0x4DBB, seek))
+
+    # Segment-relative layout: SeekHead, Info, [Cues], Clusters, [Cues].
+    head_size = len(seek_head(0)) + len(info)
+    if cues_first:
+        cue_box = cues(head_size + len(cues(0)))
+        body = seek_head(head_size) + info + cue_box + b"".join(clusters)
+        cluster_start = head_size + len(cue_box)
+    else:
+        cluster_start = head_size
+        cues_at = cluster_start + sum(len(c) for c in clusters)
+        body = seek_head(cues_at) + info + b"".join(clusters) + cues(cluster_start)
+    header = element(0x1A45DFA3, element(0x4282, b"matroska"))
+    segment = ebml_id(0x18538067) + ebml_size(len(body))
+    segment_start = len(header) + len(segment)
+    keyframes = [[i * 2.0, segment_start + cluster_start + sum(len(c) for c in clusters[:i])] for i in range(cluster_count)]
+    return header + segment + body, keyframes
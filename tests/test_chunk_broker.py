@@ -0,0 +1,68 @@
+import asyncio
+
+from bot.server.chunk_broker import ChunkBroker
+
+
+def test_waiters_share_one_fetch():
+    async def run():
+        broker = ChunkBroker(4)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return b'part'
+
+        results = await asyncio.gather(*[broker.get('k', loader) for _ in range(3)])
+        assert results == [b'part'] * 3
+        assert len(calls) == 1
+        assert await broker.get('k', loader) == b'part'
+        assert broker.hits == 1 and broker.shared == 2
+
+    asyncio.run(run())
+
+
+def test_fetch_survives_one_waiter_leaving():
+    async def run():
+        broker = ChunkBroker(4)
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return b'part'
+
+        first = asyncio.create_task(broker.get('k', loader))
+        second = asyncio.create_task(broker.get('k', loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == b'part'
+
+    asyncio.run(run())
+
+
+def test_joiner_after_last_waiter_left_gets_a_fresh_fetch():
+    async def run():
+        broker = ChunkBroker(4)
+        fetches = []
+
+        async def loader():
+            fetches.append(1)
+            await asyncio.sleep(0.01)
+            return b'part'
+
+        first = asyncio.create_task(broker.get('k', loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        # Let the first waiter's cleanup cancel the shared fetch, but join
+        # before that fetch has finished cancelling.
+        await asyncio.sleep(0)
+        assert first.cancelled()
+        second = asyncio.create_task(broker.get('k', loader))
+        assert await second == b'part'
+        assert len(fetches) == 2
+        assert 'k' not in broker.inflight
+        assert await broker.get('k', loader) == b'part'
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import asyncio
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from bot.server.faststart import get_layout, open_range, patch_moov
+from bot.server.media_index import iter_boxes, parse_moov
+from samples import chunk_layout, make_moov, make_mp4, sample_data
+
+
+class FileStreamer:
+    """Serves byte ranges of an in-memory file the way ByteStreamer.stream_range does."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.reads = []
+
+    async def stream_range(self, file_id, index, start, end):
+        self.reads.append((start, end))
+        yield memoryview(self.data)[start:end + 1]
+
+
+def chunk_offsets(moov: bytes):
+    def walk(start, end):
+        for kind, s, e in iter_boxes(moov, start, end):
+            if kind in (b"moov", b"trak", b"mdia", b"minf", b"stbl"):
+                yield from walk(s, e)
+            elif kind in (b"stco", b"co64"):
+                fmt = ">I" if kind == b"stco" else ">Q"
+                count = struct.unpack_from(">I", moov, s + 4)[0]
+                yield from (offset for offset, in struct.iter_unpack(fmt, moov[s + 8:s + 8 + count * struct.calcsize(fmt)]))
+    return list(walk(0, len(moov)))
+
+
+def virtual_file(data: bytes, unique_id: str):
+    streamer = FileStreamer(data)
+    file_id = SimpleNamespace(unique_id=unique_id, file_size=len(data))
+
+    async def build():
+        layout = await get_layout(streamer, file_id, 0)
+        body = b"".join([bytes(chunk) async for chunk in open_range(streamer, file_id, 0, layout, 0, len(data) - 1)])
+        return layout, body
+
+    layout, body = asyncio.run(build())
+    return streamer, file_id, layout, body
+
+
+@pytest.mark.parametrize("co64", [False, True])
+def test_faststart_copy_points_at_the_same_samples(co64):
+    data, _ = make_mp4(faststart=False, co64=co64)
+    _, _, layout, body = virtual_file(data, f"tail-moov-{co64}")
+    assert layout is not None
+    assert len(body) == len(data)
+    assert [kind for kind, _, _ in iter_boxes(body)] == [b"ftyp", b"moov", b"mdat"]
+    moov = next(body[s - 8:e] for kind, s, e in iter_boxes(body) if kind == b"moov")
+    for chunk, offset in zip(chunk_layout(), chunk_offsets(moov)):
+        first = sample_data(chunk[0])
+        assert body[offset:offset + len(first)] == first
+    keyframes = parse_moov(moov)["keyframes"]
+    assert keyframes and all(body[offset:offset + 4] == sample_data(1 + 60 * i)[:4] for i, (_, offset) in enumerate(keyframes))
+
+
+def test_faststart_partial_ranges_match_the_whole_copy():
+    data, _ = make_mp4(faststart=False)
+    streamer, file_id, layout, body = virtual_file(data, "tail-moov-ranges")
+    moov_start = layout[1][0]
+    moov_end = moov_start + layout[1][1]
+    ranges = [(0, 10), (moov_start - 3, moov_start + 5), (moov_end - 5, moov_end + 20), (len(body) - 7, len(body) - 1), (5, len(body) - 5)]
+
+    async def read(start, end):
+        return b"".join([bytes(chunk) async for chunk in open_range(streamer, file_id, 0, layout, start, end)])
+
+    for start, end in ranges:
+        assert asyncio.run(read(start, end)) == body[start:end + 1]
+
+
+def test_faststart_file_needs_no_layout():
+    data, _ = make_mp4(faststart=True)
+    file_id = SimpleNamespace(unique_id="head-moov", file_size=len(data))
+    assert asyncio.run(get_layout(FileStreamer(data), file_id, 0)) is None
+
+
+def test_patch_moov_shifts_only_offsets_before_the_moov():
+    moov = make_moov(100)
+    offsets = chunk_offsets(moov)
+    # Offsets at or past the moov's old position are left alone.
+    patched = patch_moov(moov, 100, offsets[5])
+    shifted = chunk_offsets(patched)
+    assert shifted[:5] == [offset + len(moov) for offset in offsets[:5]]
+    assert shifted[5:] == offsets[5:]
+    assert len(patched) == len(moov)
+
+
+def test_patch_moov_refuses_stco_overflow():
+    # The last chunk sits 10 bytes under 4 GiB, so shifting it overflows stco.
+    base = 0xFFFFFFFF - max(chunk_offsets(make_moov(100))) - 10
+    assert patch_moov(make_moov(100, base=base), 0, 1 << 40) is None
+    moov64 = make_moov(100, co64=True, base=base)
+    patched = chunk_offsets(patch_moov(moov64, 0, 1 << 40))
+    assert patched == [offset + len(moov64) for offset in chunk_offsets(moov64)]
+    assert patched[-1] > 0xFFFFFFFF
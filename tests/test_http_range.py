@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from bot.server.http_range import MAX_RANGES, multipart_body, multipart_length, parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-499", [(0, 499)]),
+    ("bytes=500-", [(500, 999)]),
+    ("bytes=-200", [(800, 999)]),
+    ("bytes=-2000", [(0, 999)]),
+    ("bytes=900-1200", [(900, 999)]),
+    ("bytes=999-999", [(999, 999)]),
+    ("bytes=0-0,-1", [(0, 0), (999, 999)]),
+    ("bytes=0-1, 4-5", [(0, 1), (4, 5)]),
+    (" BYTES = 0-1", [(0, 1)]),
+    # Unsatisfiable specs are dropped, leaving an empty list (416).
+    ("bytes=1000-", []),
+    ("bytes=-0", []),
+    ("bytes=0-1,1000-1001", [(0, 1)]),
+    # Malformed headers are ignored as a whole.
+    ("bytes=5-2", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=a-b", None),
+    ("bytes=-1-2", None),
+    ("bytes=0-1,", None),
+    (",".join(["bytes=0-0"] + ["1-1"] * MAX_RANGES), None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+def test_parse_range_empty_file():
+    assert parse_range("bytes=0-", 0) == []
+    assert parse_range("bytes=-10", 0) == []
+
+
+@pytest.mark.parametrize("header", ["bytes=0-0,-1", "bytes=10-19,500-,-3", "bytes=0-999"])
+def test_multipart_length_matches_body(header):
+    data = bytes(range(256)) * 4
+    ranges = parse_range(header, SIZE)
+
+    async def open_range(start, end):
+        yield data[start:end + 1]
+
+    async def collect():
+        return b"".join([chunk async for chunk in multipart_body("XYZ", "video/mp4", ranges, SIZE, open_range)])
+
+    body = asyncio.run(collect())
+    assert len(body) == multipart_length("XYZ", "video/mp4", ranges, SIZE)
+    for start, end in ranges:
+        part = f"Content-Range: bytes {start}-{end}/{SIZE}\r\n\r\n".encode()
+        at = body.index(part) + len(part)
+        assert body[at:at + end - start + 1] == data[start:end + 1]
+    assert body.endswith(b"--XYZ--\r\n")
@@ -0,0 +1,83 @@
+import asyncio
+import struct
+
+import pytest
+
+from bot.server.media_index import HEAD_SIZE, iter_boxes, parse_moov, probe_matroska, probe_mp4
+from samples import KEYFRAME_EVERY, SAMPLES, expected_keyframes, make_mkv, make_mp4, sample_data
+
+
+def moov_of(data: bytes) -> bytes:
+    for kind, start, end in iter_boxes(data):
+        if kind == b"moov":
+            return data[start - 8:end]
+    raise AssertionError("no moov")
+
+
+def reader(data: bytes):
+    async def read(start, end):
+        return data[start:end + 1]
+    return read
+
+
+@pytest.mark.parametrize("faststart", [True, False])
+@pytest.mark.parametrize("co64", [False, True])
+def test_parse_moov_keyframes(faststart, co64):
+    data, mdat_start = make_mp4(faststart, co64)
+    media = parse_moov(moov_of(data))
+    assert media["duration"] == 10
+    expected = expected_keyframes(mdat_start)
+    assert [offset for _, offset in media["keyframes"]] == [offset for _, offset in expected]
+    assert [time for time, _ in media["keyframes"]] == pytest.approx([time for time, _ in expected])
+    # Every keyframe offset lands on the first byte of its sample.
+    for (_, offset), sample in zip(media["keyframes"], range(1, SAMPLES + 1, KEYFRAME_EVERY)):
+        assert data[offset:offset + 8] == sample_data(sample)[:8]
+
+
+def test_parse_moov_ignores_truncated_boxes():
+    data, _ = make_mp4(True)
+    moov = moov_of(data)
+    # A moov cut short keeps its header but its children no longer fit.
+    assert parse_moov(moov[:len(moov) // 2]) == {"duration": None, "keyframes": []}
+
+
+@pytest.mark.parametrize("faststart", [True, False])
+def test_probe_mp4_layout(faststart):
+    data, mdat_start = make_mp4(faststart)
+    media = asyncio.run(probe_mp4(reader(data), f"mp4-{faststart}", len(data), data[:64]))
+    kinds = [kind for kind, _, _ in media["boxes"]]
+    assert kinds == (["ftyp", "moov", "mdat"] if faststart else ["ftyp", "mdat", "moov"])
+    assert media["faststart"] is faststart
+    assert media["mdat"][0] + 8 == mdat_start
+    moov_offset, moov_size = media["moov"]
+    assert data[moov_offset + 4:moov_offset + 8] == b"moov"
+    assert moov_offset + moov_size <= len(data)
+    assert media["keyframes"][1][1] == expected_keyframes(mdat_start)[1][1]
+
+
+def test_probe_mp4_large_box_header():
+    # A 64-bit box size (size field 1) is followed by the real size.
+    payload = b"\0" * 32
+    data = struct.pack(">I4sQ", 1, b"free", 16 + len(payload)) + payload + struct.pack(">I4s", 8, b"moov")
+    media = asyncio.run(probe_mp4(reader(data), "large-box", len(data), data[:16]))
+    assert media["boxes"] == [["free", 0, 48], ["moov", 48, 8]]
+
+
+@pytest.mark.parametrize("cues_first", [True, False])
+def test_probe_matroska_cues(cues_first):
+    # Clusters large enough that trailing Cues lie beyond the head read.
+    data, keyframes = make_mkv(HEAD_SIZE // 2, cues_first)
+    assert cues_first or data.index(b"\x1c\x53\xbb\x6b", 100) > HEAD_SIZE
+    media = asyncio.run(probe_matroska(reader(data), len(data), data[:HEAD_SIZE]))
+    assert media["duration"] == pytest.approx(8.0)
+    assert media["keyframes"] == keyframes
+    for _, position in media["keyframes"]:
+        assert data[position:position + 4] == b"\x1f\x43\xb6\x75"
+
+
+def test_probe_matroska_rejects_other_ebml():
+    data, _ = make_mkv(16, True)
+    # An EBML document whose first element after the header is not a Segment.
+    broken = data[:data.index(b"\x18\x53\x80\x67")] + b"\x1f\x43\xb6\x75\x80"
+    media = asyncio.run(probe_matroska(reader(broken), len(broken), broken))
+    assert media["keyframes"] == [] and media["duration"] is None